@@ -0,0 +1,149 @@
+import asyncio
+import enum
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import wavelink
+
+from metrics import ADMISSION_SHED, ADMISSION_WAIT
+from nodes import balancer, node_penalty
+
+
+logger = logging.getLogger('MusicBot')
+
+
+class Lane(enum.IntEnum):
+    """Priority of a Lavalink REST call, lower runs first"""
+    INTERACTIVE = 0  # Someone is waiting on a search
+    PLAYLIST = 1  # Bulk playlist loads
+    PREFETCH = 2  # Background work nobody is waiting on
+
+
+# Per lane children, so admitting a request never looks up a label
+_LANE_WAIT = {lane: ADMISSION_WAIT.labels(lane.name.lower()) for lane in Lane}
+_LANE_SHED = {lane: ADMISSION_SHED.labels(lane.name.lower()) for lane in Lane}
+
+
+class Busy(Exception):
+    """Raised when a request could not get a Lavalink slot before its deadline"""
+
+    def __init__(self, lane: Lane):
+        super().__init__(f"Lavalink is busy, {lane.name.lower()} request shed")
+        self.lane = lane
+
+
+class AdmissionController:
+    """Limits in-flight Lavalink REST calls per node
+
+    Waiting requests are admitted strictly by lane, FIFO within a lane.
+    Lower lanes can never fill a node's last slot, so a search always has
+    room next to running playlist loads. A request that is still waiting
+    when its lane's deadline passes is shed with Busy.
+    """
+
+    def __init__(self, max_inflight: int = 4, deadlines: Optional[dict] = None):
+        self.max_inflight = max_inflight
+        self.deadlines = deadlines or {Lane.INTERACTIVE: 5, Lane.PLAYLIST: 15, Lane.PREFETCH: 2}
+        self.inflight = {}  # Node identifier: running requests
+        self._waiters = {lane: deque() for lane in Lane}  # Lane: Futures resolved with a Node
+
+    def waiting(self, lane: Lane) -> int:
+        return sum(1 for future in self._waiters[lane] if not future.done())
+
+    def _limit(self, lane: Lane) -> int:
+        if lane is Lane.INTERACTIVE:
+            return self.max_inflight
+        return max(1, self.max_inflight - 1)
+
+    def _free_node(self, lane: Lane) -> Optional[wavelink.Node]:
+        limit = self._limit(lane)
+        nodes = [node for node in balancer.healthy_nodes() if self.inflight.get(node.identifier, 0) < limit]
+        if not nodes:
+            return None
+        return min(nodes, key=lambda node: (
+            self.inflight.get(node.identifier, 0), node_penalty(node, balancer.stats.get(node.identifier))
+        ))
+
+    def _take(self, node: wavelink.Node):
+        self.inflight[node.identifier] = self.inflight.get(node.identifier, 0) + 1
+
+    def _release(self, node: wavelink.Node):
+        self.inflight[node.identifier] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand freed slots to the highest priority waiters"""
+        for lane in Lane:
+            waiters = self._waiters[lane]
+            while waiters:
+                if waiters[0].done():
+                    waiters.popleft()  # Shed or cancelled
+                    continue
+                node = self._free_node(lane)
+                if node is None:
+                    # Lower lanes have lower limits, they won't fit either
+                    return
+                self._take(node)
+                waiters.popleft().set_result(node)
+
+    async def _acquire(self, lane: Lane) -> wavelink.Node:
+        if not balancer.healthy_nodes():
+            raise wavelink.InvalidNodeException("No connected Lavalink nodes available")
+
+        # Don't overtake anyone of the same or higher priority
+        if not any(self.waiting(other) for other in Lane if other <= lane):
+            node = self._free_node(lane)
+            if node is not None:
+                self._take(node)
+                _LANE_WAIT[lane].observe(0)
+                return node
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        future = loop.create_future()
+        self._waiters[lane].append(future)
+        try:
+            node = await asyncio.wait_for(future, self.deadlines[lane])
+        except asyncio.TimeoutError:
+            if not future.done() or future.cancelled():
+                _LANE_SHED[lane].inc()
+                raise Busy(lane) from None
+            node = future.result()  # Admitted just as the deadline hit
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(future.result())
+            raise
+        _LANE_WAIT[lane].observe(loop.time() - started)
+        return node
+
+    @asynccontextmanager
+    async def slot(self, lane: Lane = Lane.INTERACTIVE):
+        """Wait for a free slot, yields the node the request should go to"""
+        node = await self._acquire(lane)
+        try:
+            yield node
+        finally:
+            self._release(node)
+
+    async def fetch_tracks(self, query: str, lane: Lane = Lane.INTERACTIVE):
+        async with self.slot(lane) as node:
+            return await wavelink.Pool.fetch_tracks(query, node=node)
+
+    async def decode_tracks(self, encoded_tracks: list, lane: Lane = Lane.PLAYLIST) -> list:
+        """Playables for many encoded tracks in a single /v4/decodetracks round trip"""
+        async with self.slot(lane) as node:
+            data = await node.send('POST', path='v4/decodetracks', data=encoded_tracks)
+        return [wavelink.Playable(track) for track in data or ()]
+
+
+admission = AdmissionController(
+    max_inflight=int(os.getenv('LAVALINK_MAX_INFLIGHT', 4)),
+    deadlines={
+        Lane.INTERACTIVE: float(os.getenv('LAVALINK_SEARCH_DEADLINE', 5)),
+        Lane.PLAYLIST: float(os.getenv('LAVALINK_PLAYLIST_DEADLINE', 15)),
+        Lane.PREFETCH: float(os.getenv('LAVALINK_PREFETCH_DEADLINE', 2)),
+    }
+)
@@ -0,0 +1,124 @@
+import logging
+import random
+from collections import deque
+from typing import Callable, Optional
+
+from admission import Busy, Lane
+from guild_queue import TrackRecord
+from log_setup import spawn
+
+
+logger = logging.getLogger('MusicBot')
+
+
+def is_youtube(track) -> bool:
+    uri = track.uri or ''
+    return 'youtube.com' in uri or 'youtu.be' in uri
+
+
+def mix_url(video_id: str) -> str:
+    """YouTube's auto-generated radio for a video, Lavalink loads it as a playlist"""
+    return f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
+
+
+class Autoplay:
+    """Keeps a few related tracks ready per guild, so playback carries on when the queue runs dry
+
+    When a track starts with fewer than threshold tracks queued behind it,
+    the mix of a recently played YouTube track is resolved in the PREFETCH
+    lane, which only ever uses Lavalink capacity interactive commands don't
+    need. The ready buffer holds already resolved tracks, so the next one
+    starts without a search. on_filled is called after a prefetch added
+    tracks, in case the queue ran out while it was still resolving.
+    """
+
+    def __init__(self, search_cache, max_length: int, buffer_size: int = 3, threshold: int = 2,
+                 history_size: int = 50, default_enabled: bool = False,
+                 on_filled: Optional[Callable[[int], None]] = None):
+        self.search_cache = search_cache
+        self.max_length = max_length
+        self.buffer_size = buffer_size
+        self.threshold = threshold
+        self.history_size = history_size
+        self.default_enabled = default_enabled
+        self.on_filled = on_filled
+        self.enabled = {}  # Guild ID: bool, guilds missing here use default_enabled
+        self.buffers = {}  # Guild ID: deque of TrackRecords ready to play
+        self.history = {}  # Guild ID: deque of recently played identifiers, never suggested again
+        self.seeds = {}  # Guild ID: deque of recent YouTube video IDs to build mixes from
+        self._tasks = {}  # Guild ID: running prefetch Task
+
+    def is_enabled(self, guild_id: int) -> bool:
+        return self.enabled.get(guild_id, self.default_enabled)
+
+    def toggle(self, guild_id: int) -> bool:
+        enabled = not self.is_enabled(guild_id)
+        self.enabled[guild_id] = enabled
+        if not enabled:
+            self._drop_buffer(guild_id)
+        return enabled
+
+    def track_started(self, guild_id: int, track, queue_length: int) -> None:
+        """Remember the track and top up the buffer if the queue is running low"""
+        history = self.history.setdefault(guild_id, deque(maxlen=self.history_size))
+        history.append(track.identifier)
+        if is_youtube(track):
+            self.seeds.setdefault(guild_id, deque(maxlen=3)).append(track.identifier)
+
+        if queue_length < self.threshold:
+            self.prefetch(guild_id)
+
+    def prefetch(self, guild_id: int) -> None:
+        if not self.is_enabled(guild_id) or not self.seeds.get(guild_id):
+            return
+        if len(self.buffers.get(guild_id, ())) >= self.buffer_size:
+            return
+        task = self._tasks.get(guild_id)
+        if task and not task.done():
+            return
+
+        # A random recent seed keeps the mix from drifting down one path
+        seed = random.choice(self.seeds[guild_id])
+        task = self._tasks[guild_id] = spawn(self._fill(guild_id, seed), guild=guild_id)
+        task.add_done_callback(lambda done: self._tasks.pop(guild_id, None) if self._tasks.get(guild_id) is done else None)
+
+    async def _fill(self, guild_id: int, seed: str) -> None:
+        try:
+            tracks = await self.search_cache.fetch_tracks(mix_url(seed), Lane.PREFETCH)
+        except Busy:
+            return  # Lavalink is busy with people, try again at the next track boundary
+        except Exception as e:
+            logger.warning(f"Autoplay prefetch failed for guild {guild_id}: {e}")
+            return
+
+        buffer = self.buffers.setdefault(guild_id, deque())
+        skip = set(self.history.get(guild_id, ())) | {record.identifier for record in buffer}
+        before = len(buffer)
+        for track in tracks or ():
+            if len(buffer) >= self.buffer_size:
+                break
+            if track.identifier in skip or track.is_stream or track.length > self.max_length:
+                continue
+            buffer.append(TrackRecord.from_playable(track))
+            skip.add(track.identifier)
+        if len(buffer) > before and self.on_filled is not None:
+            self.on_filled(guild_id)
+
+    def next_track(self, guild_id: int) -> Optional[TrackRecord]:
+        """A ready track to play when the queue is empty, if autoplay is on"""
+        buffer = self.buffers.get(guild_id)
+        if not self.is_enabled(guild_id) or not buffer:
+            return None
+        return buffer.popleft()
+
+    def _drop_buffer(self, guild_id: int) -> None:
+        task = self._tasks.pop(guild_id, None)
+        if task:
+            task.cancel()
+        self.buffers.pop(guild_id, None)
+
+    def discard(self, guild_id: int) -> None:
+        """Forget the guild's session, keeps only whether autoplay is on"""
+        self._drop_buffer(guild_id)
+        self.history.pop(guild_id, None)
+        self.seeds.pop(guild_id, None)
@@ -0,0 +1,172 @@
+"""Offline throughput benchmark for the Music cog
+
+Runs the real cog against an in-process fake Lavalink node and fake Discord
+objects, driving N guilds through play / skip / track end / queue paging.
+
+Usage (from the Bot directory):
+    python bench/bench_music.py --guilds 200 --rounds 5
+    python bench/bench_music.py --guilds 50 --lavalink-latency 0.2 --failure-rate 0.05 --tracemalloc
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fake_lavalink import FakeLavalink
+from fake_discord import FakeContext, FakeGuild, FakeInteraction
+
+
+def percentile(values: list, percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # Command name: [seconds]
+
+    async def timed(self, name: str, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+
+    @property
+    def total(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+
+async def drive_guild(cog, bot, guild, recorder: Recorder, rounds: int, songs: list):
+    """One guild's session: a playlist, some searches, skips and queue paging"""
+    # Commands are looked up on the bot, like the command handler does
+    play = bot.get_command('play').callback
+    skip = bot.get_command('skip').callback
+    queue = bot.get_command('queue').callback
+
+    await recorder.timed('play_playlist', play(
+        cog, FakeContext(bot, guild, 'play'), search=f'https://www.youtube.com/playlist?list=PL{guild.id}'
+    ))
+    for round_number in range(rounds):
+        for song in songs:
+            await recorder.timed('play', play(cog, FakeContext(bot, guild, 'play'), search=song))
+        await recorder.timed('skip', skip(cog, FakeContext(bot, guild, 'skip')))
+        await recorder.timed('queue', queue(cog, FakeContext(bot, guild, 'queue')))
+
+        # Page through the queue like a user would
+        queue_list = cog.get_queue(guild.id)
+        view = sys.modules['lava'].QueueView(queue_list=queue_list, current_track=None)
+        for _ in range(min(view.total_pages - 1, 3)):
+            await recorder.timed('queue_page', view.next_button.callback(FakeInteraction(bot, guild)))
+
+        # Let a few tracks end on their own
+        await asyncio.sleep(0.05)
+
+
+async def run(args):
+    logging.basicConfig(level=logging.WARNING)
+
+    node = await FakeLavalink(
+        latency=args.lavalink_latency, failure_rate=args.failure_rate,
+        playlist_size=args.playlist_size, track_duration=args.track_duration
+    ).start()
+
+    workdir = tempfile.mkdtemp(prefix='musicbot-bench-')
+    os.environ['LAVALINK_NODES'] = node.uri
+    os.environ['LAVALINK_PASSWORD'] = node.password
+    os.environ['QUEUE_DB_PATH'] = os.path.join(workdir, 'queues.db')
+    os.environ['TRACK_STORE_PATH'] = os.path.join(workdir, 'tracks.db')
+    os.environ['RESUME_STATE_PATH'] = os.path.join(workdir, 'resume.json')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import lava
+    import wavelink
+    from nodes import load_nodes_from_env
+
+    bot = lava.bot
+    # Enough of a logged in client for wavelink, event dispatch and the cog
+    await bot._async_setup_hook()
+    bot._connection.user = SimpleNamespace(id=1, name='bench', bot=True)
+
+    await wavelink.Pool.connect(nodes=load_nodes_from_env(), client=bot)
+    while not all(n.status is wavelink.NodeStatus.CONNECTED for n in wavelink.Pool.nodes.values()):
+        await asyncio.sleep(0.01)
+
+    cog = lava.Music(bot)
+    await bot.add_cog(cog)
+
+    track_ends = 0
+
+    async def count_track_end(payload):
+        nonlocal track_ends
+        track_ends += 1
+    bot.add_listener(count_track_end, 'on_wavelink_track_end')
+
+    guilds = [FakeGuild(bot, channel_latency=args.discord_latency) for _ in range(args.guilds)]
+    songs = [f'benchmark song {index % args.distinct_songs}' for index in range(args.songs_per_round)]
+    recorder = Recorder()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(drive_guild(cog, bot, guild, recorder, args.rounds, songs) for guild in guilds))
+    # Let the background playlist ingestion drain
+    while any(state.ingest_task for state in cog.guilds.values()):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    peak_traced = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"\n{args.guilds} guilds, {args.rounds} rounds, {recorder.total} commands in {elapsed:.2f}s")
+    print(f"Throughput: {recorder.total / elapsed:.1f} commands/s")
+    print(f"{'command':<16}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in sorted(recorder.latencies.items()):
+        print(f"{name:<16}{len(values):>8}{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}{max(values) * 1000:>10.2f}")
+    print(f"Track end events: {track_ends}")
+    print(f"Lavalink REST requests: {node.requests} ({node.load_requests} loadtracks)")
+    print(f"Search cache: {cog.search_cache.stats()}")
+    print(f"Discord API calls: {sum(g.text_channel.api_calls for g in guilds)}")
+    print(f"Peak RSS: {max_rss_kb / 1024:.1f} MiB")
+    if peak_traced is not None:
+        print(f"Peak traced Python memory: {peak_traced / 1024 / 1024:.1f} MiB")
+
+    # Let the remaining track end events settle before shutting down
+    await asyncio.sleep(args.track_duration * 2)
+    await bot.remove_cog('Music')
+    await wavelink.Pool.close()
+    await node.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--songs-per-round', type=int, default=5)
+    parser.add_argument('--distinct-songs', type=int, default=30, help="How many different songs guilds pick from")
+    parser.add_argument('--playlist-size', type=int, default=200)
+    parser.add_argument('--track-duration', type=float, default=0.5, help="Seconds before a fake track ends")
+    parser.add_argument('--lavalink-latency', type=float, default=0.0, help="Mean fake Lavalink REST latency (s)")
+    parser.add_argument('--discord-latency', type=float, default=0.0, help="Mean fake Discord REST latency (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of loadtracks calls that fail")
+    parser.add_argument('--tracemalloc', action='store_true', help="Track peak Python heap (slower)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Randomized check of GuildQueue against a plain list
+
+Applies the same random operations to a GuildQueue and to a list of the
+same records, and compares every position, page, start offset and the
+total length after each one. A small block size makes blocks split and
+empty out all the time, which is where prefix sum mistakes hide.
+
+Usage (from the Bot directory):
+    python bench/check_guild_queue.py
+    python bench/check_guild_queue.py --ops 100000 --seed 7 --block-size 2
+"""
+import argparse
+import os
+import random
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from guild_queue import GuildQueue, TrackRecord
+
+
+def check(queue: GuildQueue, model: list, rng: random.Random) -> None:
+    assert len(queue) == len(model), (len(queue), len(model))
+    assert bool(queue) == bool(model)
+    assert list(queue) == model
+    assert queue.total_length == sum(track.length for track in model)
+    if not model:
+        return
+
+    for index in {0, len(model) - 1, rng.randrange(len(model)), -rng.randint(1, len(model))}:
+        assert queue[index] is model[index], index
+        assert queue.start_offset(index) == sum(track.length for track in model[:index % len(model)]), index
+
+    start = rng.randrange(len(model) + 2)
+    stop = start + rng.randint(0, 12)
+    assert queue.page(start, stop) == model[start:stop], (start, stop)
+
+
+def run(ops: int, seed: int, block_size: int) -> None:
+    rng = random.Random(seed)
+    queue = GuildQueue()
+    queue.BLOCK_SIZE = block_size
+    model = []
+    counter = 0
+
+    def record() -> TrackRecord:
+        nonlocal counter
+        counter += 1
+        return TrackRecord(f"encoded{counter}", f"track {counter}", rng.randint(0, 600000))
+
+    for _ in range(ops):
+        roll = rng.random()
+        if roll < 0.25 or not model:
+            track = record()
+            queue.append(track)
+            model.append(track)
+        elif roll < 0.35:
+            tracks = [record() for _ in range(rng.randint(0, 3 * block_size))]
+            queue.extend(tracks)
+            model.extend(tracks)
+        elif roll < 0.5:
+            assert queue.popleft() is model.pop(0)
+        elif roll < 0.65:
+            index = rng.randrange(len(model))
+            assert queue.remove_at(index) is model.pop(index)
+        elif roll < 0.9:
+            source = rng.randrange(len(model))
+            destination = rng.randint(-2, len(model) + 2)
+            track = model.pop(source)
+            model.insert(min(max(destination, 0), len(model)), track)
+            assert queue.move(source, destination) is track
+        elif roll < 0.97:
+            # Same seed for both, so the model gets the same Fisher-Yates swaps
+            shuffle_seed = rng.random()
+            queue.shuffle(random.Random(shuffle_seed))
+            swaps = random.Random(shuffle_seed)
+            for index in range(len(model) - 1, 0, -1):
+                other = swaps.randint(0, index)
+                model[index], model[other] = model[other], model[index]
+        else:
+            queue.clear()
+            model.clear()
+        check(queue, model, rng)
+
+    for index in (len(model), -len(model) - 1):
+        try:
+            queue[index]
+        except IndexError:
+            pass
+        else:
+            raise AssertionError(f"queue[{index}] should be out of range")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--block-size', type=int, default=4, help="GuildQueue.BLOCK_SIZE to check with")
+    args = parser.parse_args()
+    run(args.ops, args.seed, args.block_size)
+    print(f"GuildQueue matched the list model for {args.ops} operations (seed {args.seed})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Minimal stand-ins for the discord.py objects the Music cog touches"""
+import asyncio
+import itertools
+import random
+
+
+_ids = itertools.count(10**17)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None):
+        self.id = next_id()
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.edits = 0
+
+    async def edit(self, content=None, embed=None, view=None, **kwargs):
+        await self.channel._api_call()
+        self.content = content if content is not None else self.content
+        self.embed = embed if embed is not None else self.embed
+        self.edits += 1
+
+    async def delete(self):
+        await self.channel._api_call()
+
+
+class FakeTextChannel:
+    """Records what the bot sends, with an optional simulated Discord REST latency"""
+
+    def __init__(self, guild, latency: float = 0.0):
+        self.id = next_id()
+        self.guild = guild
+        self.name = f"text-{self.id}"
+        self.latency = latency
+        self.sent = []
+        self.api_calls = 0
+
+    async def _api_call(self):
+        self.api_calls += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        await self._api_call()
+        message = FakeMessage(self, content, embed, view)
+        self.sent.append(message)
+        return message
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.id = next_id()
+        self.guild = guild
+        self.name = f"voice-{self.id}"
+        self.members = []
+
+    async def connect(self, *, cls, **kwargs):
+        """Create the player without a real voice handshake"""
+        player = cls(self.guild.bot, self)
+        player._guild = self.guild
+        player._connected = True
+        player.node._players[self.guild.id] = player
+        self.guild.voice_client = player
+        return player
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, guild, voice_channel=None, bot: bool = False):
+        self.id = next_id()
+        self.guild = guild
+        self.bot = bot
+        self.name = f"user-{self.id}"
+        self.display_name = self.name
+        self.mention = f"<@{self.id}>"
+        self.voice = FakeVoiceState(voice_channel) if voice_channel else None
+
+
+class FakeGuild:
+    def __init__(self, bot, channel_latency: float = 0.0):
+        self.id = next_id()
+        self.name = f"guild-{self.id}"
+        self.bot = bot
+        self.voice_client = None
+        self.text_channel = FakeTextChannel(self, latency=channel_latency)
+        self.system_channel = self.text_channel
+        self.voice_channel = FakeVoiceChannel(self)
+        self.member = FakeMember(self, self.voice_channel)
+        self.voice_channel.members.append(self.member)
+
+    def get_channel(self, channel_id: int):
+        return {self.text_channel.id: self.text_channel, self.voice_channel.id: self.voice_channel}.get(channel_id)
+
+    get_channel_or_thread = get_channel
+
+
+class FakeCommand:
+    def __init__(self, name: str):
+        self.name = name
+        self.qualified_name = name
+
+
+class FakeContext:
+    """Just the commands.Context surface the cog uses"""
+
+    def __init__(self, bot, guild: FakeGuild, command: str):
+        self.bot = bot
+        self.guild = guild
+        self.channel = guild.text_channel
+        self.author = guild.member
+        self.command = FakeCommand(command)
+        self.message = None
+        self.interaction = None  # Prefix command
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeResponse:
+    def __init__(self, channel):
+        self.channel = channel
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        await self.channel._api_call()
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+        await self.channel._api_call()
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+
+class FakeInteraction:
+    def __init__(self, bot, guild: FakeGuild):
+        self.client = bot
+        self.guild = guild
+        self.channel = guild.text_channel
+        self.user = guild.member
+        self.response = FakeResponse(guild.text_channel)
@@ -0,0 +1,307 @@
+"""In-process stand-in for a Lavalink v4 node
+
+Implements just enough of the REST API (info, stats, loadtracks, decodetrack(s),
+session/player updates) and the websocket event stream for wavelink and the
+Music cog to run against it. Latency and failures can be injected.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web, WSMsgType
+
+
+def encode_track(info: dict) -> str:
+    return base64.b64encode(json.dumps(info, separators=(',', ':')).encode()).decode()
+
+
+def decode_track(encoded: str) -> dict:
+    return json.loads(base64.b64decode(encoded))
+
+
+def make_track(seed: str, index: int = 0, long_track_ratio: float = 0.1) -> dict:
+    """Deterministic fake track, some of them over the bot's 10 minute limit"""
+    digest = hashlib.sha1(f"{seed}:{index}".encode()).hexdigest()
+    identifier = digest[:11]
+    bucket = int(digest[11:15], 16) / 0xFFFF
+    length = 660000 + int(bucket * 600000) if bucket < long_track_ratio else 90000 + int(bucket * 300000)
+    info = {
+        "identifier": identifier,
+        "isSeekable": True,
+        "author": f"Artist {digest[15:19]}",
+        "length": length,
+        "isStream": False,
+        "position": 0,
+        "title": f"{seed} #{index}" if index else seed,
+        "uri": f"https://www.youtube.com/watch?v={identifier}",
+        "artworkUrl": None,
+        "isrc": None,
+        "sourceName": "youtube",
+    }
+    return {"encoded": encode_track(info), "info": info, "pluginInfo": {}, "userData": {}}
+
+
+class FakeLavalink:
+    """Fake Lavalink v4 node served by aiohttp
+
+    latency: mean REST latency in seconds (exponentially distributed)
+    failure_rate: fraction of loadtracks calls answered with a load error
+    playlist_size: tracks returned for URLs containing "list="
+    track_duration: wall clock seconds a track "plays" before TrackEndEvent
+    """
+
+    def __init__(self, password: str = 'youshallnotpass', latency: float = 0.0, failure_rate: float = 0.0,
+                 playlist_size: int = 200, track_duration: float = 1.0, stats_interval: float = 5.0):
+        self.password = password
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.playlist_size = playlist_size
+        self.track_duration = track_duration
+        self.stats_interval = stats_interval
+
+        self.sessions = {}  # Session ID: websocket
+        self.known_sessions = set()  # Every session ID handed out, they can be resumed
+        self.players = {}  # (Session ID, guild ID): player dict
+        self._end_timers = {}  # (Session ID, guild ID): TimerHandle
+        self.requests = 0
+        self.load_requests = 0
+        self.started_at = time.monotonic()
+        self._runner = None
+        self.port = None
+
+        self.app = web.Application(middlewares=[self._auth])
+        self.app.router.add_get('/version', self.version)
+        self.app.router.add_get('/v4/info', self.info)
+        self.app.router.add_get('/v4/stats', self.stats)
+        self.app.router.add_get('/v4/loadtracks', self.load_tracks)
+        self.app.router.add_get('/v4/decodetrack', self.decode_one)
+        self.app.router.add_post('/v4/decodetracks', self.decode_many)
+        self.app.router.add_get('/v4/websocket', self.websocket)
+        self.app.router.add_patch('/v4/sessions/{session_id}', self.update_session)
+        self.app.router.add_get('/v4/sessions/{session_id}/players', self.get_players)
+        self.app.router.add_get('/v4/sessions/{session_id}/players/{guild_id}', self.get_player)
+        self.app.router.add_patch('/v4/sessions/{session_id}/players/{guild_id}', self.update_player)
+        self.app.router.add_delete('/v4/sessions/{session_id}/players/{guild_id}', self.destroy_player)
+
+    @property
+    def uri(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, port: int = 0):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for timer in self._end_timers.values():
+            timer.cancel()
+        for ws in list(self.sessions.values()):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    @web.middleware
+    async def _auth(self, request, handler):
+        if request.headers.get('Authorization') != self.password:
+            return web.json_response({"status": 401, "error": "Unauthorized", "message": "", "path": request.path},
+                                     status=401)
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+        return await handler(request)
+
+    async def version(self, request):
+        return web.Response(text="4.0.8")
+
+    async def info(self, request):
+        return web.json_response({
+            "version": {"semver": "4.0.8", "major": 4, "minor": 0, "patch": 8, "preRelease": None, "build": None},
+            "buildTime": 0, "git": {"branch": "fake", "commit": "fake", "commitTime": 0},
+            "jvm": "fake", "lavaplayer": "fake",
+            "sourceManagers": ["youtube", "soundcloud", "http"], "filters": [], "plugins": [],
+        })
+
+    def _stats_payload(self) -> dict:
+        playing = sum(1 for player in self.players.values() if player["track"] and not player["paused"])
+        return {
+            "players": len(self.players),
+            "playingPlayers": playing,
+            "uptime": int((time.monotonic() - self.started_at) * 1000),
+            "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+            "cpu": {"cores": 1, "systemLoad": 0.0, "lavalinkLoad": 0.0},
+            "frameStats": {"sent": 3000 * playing, "nulled": 0, "deficit": 0},
+        }
+
+    async def stats(self, request):
+        return web.json_response(self._stats_payload())
+
+    async def load_tracks(self, request):
+        self.load_requests += 1
+        identifier = request.query.get('identifier', '')
+        if random.random() < self.failure_rate:
+            return web.json_response({"loadType": "error", "data": {
+                "message": "Injected failure", "severity": "common", "cause": "FakeLavalink"
+            }})
+
+        if 'list=' in identifier:
+            tracks = [make_track(identifier, index) for index in range(1, self.playlist_size + 1)]
+            return web.json_response({"loadType": "playlist", "data": {
+                "info": {"name": f"Playlist {identifier[-8:]}", "selectedTrack": -1},
+                "pluginInfo": {}, "tracks": tracks,
+            }})
+
+        prefix, sep, query = identifier.partition(':')
+        if sep and prefix.endswith('search'):
+            return web.json_response({"loadType": "search", "data": [
+                make_track(query.strip(), index) for index in range(5)
+            ]})
+
+        if identifier.startswith(('http://', 'https://')):
+            return web.json_response({"loadType": "track", "data": make_track(identifier)})
+        return web.json_response({"loadType": "empty", "data": {}})
+
+    async def decode_one(self, request):
+        encoded = request.query.get('encodedTrack', '')
+        return web.json_response({"encoded": encoded, "info": decode_track(encoded), "pluginInfo": {}})
+
+    async def decode_many(self, request):
+        encoded_tracks = await request.json()
+        return web.json_response([
+            {"encoded": encoded, "info": decode_track(encoded), "pluginInfo": {}, "userData": {}}
+            for encoded in encoded_tracks
+        ])
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        requested = request.headers.get('Session-Id')
+        resumed = requested in self.known_sessions
+        session_id = requested if resumed else uuid.uuid4().hex[:16]
+        self.known_sessions.add(session_id)
+        self.sessions[session_id] = ws
+        await ws.send_json({"op": "ready", "resumed": resumed, "sessionId": session_id})
+
+        stats_task = asyncio.create_task(self._send_stats(ws))
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            stats_task.cancel()
+            if self.sessions.get(session_id) is ws:
+                del self.sessions[session_id]
+        return ws
+
+    async def _send_stats(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.stats_interval)
+            await ws.send_json({"op": "stats", **self._stats_payload()})
+
+    async def _send_event(self, session_id: str, guild_id: str, event: dict):
+        ws = self.sessions.get(session_id)
+        if ws is not None and not ws.closed:
+            await ws.send_json({"op": "event", "guildId": guild_id, **event})
+
+    async def update_session(self, request):
+        data = await request.json()
+        return web.json_response({"resuming": data.get("resuming", False), "timeout": data.get("timeout", 60)})
+
+    def _player_response(self, guild_id: str, player: dict) -> dict:
+        return {
+            "guildId": guild_id,
+            "track": player["track"],
+            "volume": player["volume"],
+            "paused": player["paused"],
+            "state": {"time": int(time.time() * 1000), "position": 0, "connected": True, "ping": 0},
+            "voice": {"token": "", "endpoint": "", "sessionId": ""},
+            "filters": {},
+        }
+
+    async def get_players(self, request):
+        session_id = request.match_info['session_id']
+        return web.json_response([
+            self._player_response(guild_id, player)
+            for (sid, guild_id), player in self.players.items() if sid == session_id
+        ])
+
+    async def get_player(self, request):
+        key = (request.match_info['session_id'], request.match_info['guild_id'])
+        player = self.players.get(key)
+        if player is None:
+            return web.json_response({"status": 404, "error": "Not Found", "message": "Player not found",
+                                      "path": request.path}, status=404)
+        return web.json_response(self._player_response(key[1], player))
+
+    async def update_player(self, request):
+        session_id, guild_id = request.match_info['session_id'], request.match_info['guild_id']
+        key = (session_id, guild_id)
+        data = await request.json()
+        player = self.players.setdefault(key, {"track": None, "volume": 100, "paused": False})
+        no_replace = request.query.get('noReplace', 'False').lower() == 'true'
+
+        if 'volume' in data:
+            player["volume"] = data["volume"]
+        if 'paused' in data:
+            player["paused"] = data["paused"]
+
+        if 'track' in data and not (no_replace and player["track"]):
+            encoded = data["track"].get("encoded")
+            previous = player["track"]
+            timer = self._end_timers.pop(key, None)
+            if timer:
+                timer.cancel()
+
+            if previous:
+                reason = "replaced" if encoded else "stopped"
+                await self._send_event(session_id, guild_id, {"type": "TrackEndEvent", "track": previous, "reason": reason})
+
+            if encoded:
+                player["track"] = {"encoded": encoded, "info": decode_track(encoded), "pluginInfo": {}, "userData": {}}
+                await self._send_event(session_id, guild_id, {"type": "TrackStartEvent", "track": player["track"]})
+                self._end_timers[key] = asyncio.get_running_loop().call_later(
+                    self.track_duration, lambda: asyncio.create_task(self._finish(key))
+                )
+            else:
+                player["track"] = None
+
+        return web.json_response(self._player_response(guild_id, player))
+
+    async def _finish(self, key: tuple):
+        self._end_timers.pop(key, None)
+        player = self.players.get(key)
+        if player and player["track"]:
+            track, player["track"] = player["track"], None
+            await self._send_event(key[0], key[1], {"type": "TrackEndEvent", "track": track, "reason": "finished"})
+
+    async def destroy_player(self, request):
+        key = (request.match_info['session_id'], request.match_info['guild_id'])
+        timer = self._end_timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        self.players.pop(key, None)
+        return web.Response(status=204)
+
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake Lavalink node standalone")
+    parser.add_argument('--port', type=int, default=2333)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    node = await FakeLavalink(latency=args.latency, failure_rate=args.failure_rate).start(args.port)
+    print(f"Fake Lavalink listening on {node.uri}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+"""Run MusicBot as several worker processes, each owning a range of shards
+
+Usage:
+    python cluster.py
+
+Environment:
+    CLUSTER_COUNT - number of worker processes (default: CPU count)
+    SHARD_COUNT - total shards (default: Discord's recommendation)
+    CLUSTER_STAGGER - seconds between worker launches, so identifies don't collide (default: 5)
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import urllib.request
+from multiprocessing.connection import wait
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+
+logger = logging.getLogger('MusicBot')
+
+REPORT_INTERVAL = 10  # Seconds between worker stats reports / supervisor broadcasts
+
+
+class ClusterLink:
+    """Worker side of the IPC pipe to the supervisor
+
+    Workers push their local stats, the supervisor broadcasts everyone's
+    latest stats back, so cross-cluster queries are answered locally.
+    """
+
+    def __init__(self, conn, cluster_id: int):
+        self.conn = conn
+        self.cluster_id = cluster_id
+        self.clusters = {}  # Cluster ID: last reported stats
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, collect: Callable[[], dict]):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._report_loop(collect))
+            threading.Thread(target=self._read_loop, name='cluster-ipc', daemon=True).start()
+
+    def total(self, key: str) -> int:
+        return sum(stats.get(key, 0) for stats in self.clusters.values())
+
+    async def _report_loop(self, collect: Callable[[], dict]):
+        while True:
+            try:
+                stats = collect()
+                self.clusters[self.cluster_id] = stats
+                self.conn.send({"type": "stats", "cluster": self.cluster_id, "stats": stats})
+            except Exception as e:
+                logger.error(f"Failed to report cluster stats: {e}")
+            await asyncio.sleep(REPORT_INTERVAL)
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                logger.error("Lost connection to cluster supervisor")
+                return
+            if message.get("type") == "stats":
+                # Keep our own numbers fresher than the broadcast
+                own = self.clusters.get(self.cluster_id)
+                clusters = dict(message["clusters"])
+                if own is not None:
+                    clusters[self.cluster_id] = own
+                self.clusters = clusters
+
+
+def run_worker(cluster_id: int, shard_ids: list, shard_count: int, conn):
+    """Process entry point, every worker gets its own bot, Lavalink pool and web server port"""
+    os.environ['SHARD_IDS'] = ",".join(str(shard_id) for shard_id in shard_ids)
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    os.environ['CLUSTER_ID'] = str(cluster_id)
+    os.environ['PORT'] = str(int(os.getenv('PORT', 8080)) + cluster_id)
+
+    import lava
+    lava.cluster_link = ClusterLink(conn, cluster_id)
+    lava.main()
+
+
+def recommended_shard_count(token: str) -> int:
+    request = urllib.request.Request(
+        'https://discord.com/api/v10/gateway/bot',
+        headers={'Authorization': f'Bot {token}', 'User-Agent': 'MusicBot cluster'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as resp:
+        return json.load(resp)['shards']
+
+
+def split_shards(shard_count: int, cluster_count: int) -> list:
+    """Contiguous, evenly sized shard ranges, one per cluster"""
+    cluster_count = max(1, min(cluster_count, shard_count))
+    base, extra = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = base + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+class Supervisor:
+    """Starts one process per shard range, relays stats between them and restarts crashed workers"""
+
+    def __init__(self, shard_ranges: list, shard_count: int, stagger: float = 5):
+        self.shard_ranges = shard_ranges
+        self.shard_count = shard_count
+        self.stagger = stagger
+        self.ctx = multiprocessing.get_context('spawn')
+        self.workers = {}  # Cluster ID: (Process, Connection)
+        self.started_at = {}  # Cluster ID: monotonic start time
+        self.restarts = {}  # Cluster ID: consecutive quick crashes
+        self.restart_at = {}  # Cluster ID: when a crashed worker may be started again
+        self.stats = {}  # Cluster ID: last stats report
+
+    def start_worker(self, cluster_id: int):
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(
+            target=run_worker,
+            args=(cluster_id, self.shard_ranges[cluster_id], self.shard_count, child_conn),
+            name=f'musicbot-cluster-{cluster_id}',
+            daemon=False
+        )
+        process.start()
+        child_conn.close()
+        self.workers[cluster_id] = (process, parent_conn)
+        self.started_at[cluster_id] = time.monotonic()
+        logger.info(f"Started cluster {cluster_id} (pid {process.pid}) with shards {self.shard_ranges[cluster_id]}")
+
+    def run(self):
+        for cluster_id in range(len(self.shard_ranges)):
+            self.start_worker(cluster_id)
+            if cluster_id < len(self.shard_ranges) - 1:
+                time.sleep(self.stagger)
+
+        last_broadcast = time.monotonic()
+        try:
+            while True:
+                conns = {
+                    conn: cluster_id for cluster_id, (process, conn) in self.workers.items() if process.is_alive()
+                }
+                for conn in wait(list(conns), timeout=1):
+                    self._receive(conns[conn], conn)
+
+                if time.monotonic() - last_broadcast >= REPORT_INTERVAL:
+                    last_broadcast = time.monotonic()
+                    self._broadcast()
+
+                self._check_workers()
+        except KeyboardInterrupt:
+            logger.info("Shutting down cluster")
+        finally:
+            for process, _ in self.workers.values():
+                process.terminate()
+            for process, _ in self.workers.values():
+                process.join(10)
+
+    def _receive(self, cluster_id: int, conn):
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return  # Worker died, _check_workers takes care of it
+        if message.get("type") == "stats":
+            self.stats[cluster_id] = message["stats"]
+
+    def _broadcast(self):
+        message = {"type": "stats", "clusters": self.stats}
+        for process, conn in self.workers.values():
+            if process.is_alive():
+                try:
+                    conn.send(message)
+                except (BrokenPipeError, OSError):
+                    pass
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for cluster_id, (process, conn) in list(self.workers.items()):
+            if process.is_alive():
+                continue
+
+            if cluster_id not in self.restart_at:
+                # Back off if the worker keeps dying right after starting
+                if now - self.started_at[cluster_id] < 60:
+                    self.restarts[cluster_id] = self.restarts.get(cluster_id, 0) + 1
+                else:
+                    self.restarts[cluster_id] = 0
+                delay = min(2 ** self.restarts[cluster_id], 60)
+                self.restart_at[cluster_id] = now + delay
+                self.stats.pop(cluster_id, None)
+                logger.error(f"Cluster {cluster_id} exited with code {process.exitcode}, restarting in {delay}s")
+
+            if now >= self.restart_at[cluster_id]:
+                del self.restart_at[cluster_id]
+                conn.close()
+                self.start_worker(cluster_id)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    token = os.getenv('BOT_TOKEN')
+    if not token:
+        raise ValueError("BOT_TOKEN not found in environment variables")
+
+    shard_count = int(os.getenv('SHARD_COUNT', 0)) or recommended_shard_count(token)
+    cluster_count = int(os.getenv('CLUSTER_COUNT', os.cpu_count() or 1))
+    shard_ranges = split_shards(shard_count, cluster_count)
+    logger.info(f"Running {shard_count} shards across {len(shard_ranges)} clusters")
+
+    Supervisor(shard_ranges, shard_count, stagger=float(os.getenv('CLUSTER_STAGGER', 5))).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import logging
+import time
+
+import discord
+from discord.webhook.async_ import async_context
+
+from metrics import DISCORD_RATE_LIMITED, DISCORD_REQUEST_LATENCY, DISCORD_REQUESTS, Children
+
+
+_RATE_LIMITED_BOT = DISCORD_RATE_LIMITED.labels('bot')
+_RATE_LIMITED_GLOBAL = DISCORD_RATE_LIMITED.labels('global')
+_RATE_LIMITED_WEBHOOK = DISCORD_RATE_LIMITED.labels('webhook')
+# Method, then route, then status
+_REQUESTS = Children(DISCORD_REQUESTS)
+_REQUEST_LATENCY = Children(DISCORD_REQUEST_LATENCY)
+
+
+class RateLimitCounter(logging.Filter):
+    """Counts the 429s discord.py logs before sleeping and retrying, every record still passes
+
+    Those retries happen inside discord.py's request loop, so a wrapper
+    around the request only ever sees the final response.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.msg if isinstance(record.msg, str) else ""
+        if message.startswith("We are being rate limited."):
+            _RATE_LIMITED_BOT.inc()
+        elif message.startswith("Global rate limit has been hit"):
+            _RATE_LIMITED_GLOBAL.inc()
+        elif "is rate limited. Retrying" in message:
+            _RATE_LIMITED_WEBHOOK.inc()
+        return True
+
+
+def _counted(request):
+    async def counted_request(route, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await request(route, *args, **kwargs)
+            status = "ok"
+            return response
+        except discord.RateLimited:
+            status = "429"
+            raise
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        finally:
+            # Route paths are templates like /channels/{channel_id}/messages, so labels stay bounded
+            _REQUESTS[route.method][route.path][status].inc()
+            _REQUEST_LATENCY[route.method][route.path].observe(time.perf_counter() - started)
+    return counted_request
+
+
+def instrument(client: discord.Client) -> None:
+    """Count and time every Discord REST call the client makes
+
+    Covers the bot's HTTP client (messages, edits, voice, commands sync)
+    and the webhook adapter interaction responses and followups go
+    through, not just what the outbox sends.
+    """
+    client.http.request = _counted(client.http.request)
+    adapter = async_context.get()
+    adapter.request = _counted(adapter.request)
+
+    counter = RateLimitCounter()
+    for name in ('discord.http', 'discord.webhook.async_'):
+        logging.getLogger(name).addFilter(counter)
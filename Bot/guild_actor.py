@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from log_setup import log_context, spawn
+
+
+logger = logging.getLogger('MusicBot')
+
+
+class MailboxFull(Exception):
+    """Raised when a guild already has too many pending operations"""
+
+
+class _Operation:
+    __slots__ = ('func', 'merge_key', 'count', 'future', 'log_fields')
+
+    def __init__(self, func, merge_key, future, log_fields):
+        self.func = func
+        self.merge_key = merge_key
+        self.count = 1
+        self.future = future
+        self.log_fields = log_fields  # Log context of whoever submitted it
+
+
+class GuildActor:
+    """Runs one guild's player/queue operations one at a time, in order"""
+
+    def __init__(self, guild_id: int, mailbox_size: int, on_idle: Callable[[int], None]):
+        self.guild_id = guild_id
+        self.mailbox_size = mailbox_size
+        self.mailbox = deque()
+        self._on_idle = on_idle
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, func: Callable, merge_key: Optional[str] = None, bounded: bool = True) -> asyncio.Future:
+        # Fold into the last pending operation of the same kind, e.g. 3 skips -> skip 3
+        if merge_key and self.mailbox and self.mailbox[-1].merge_key == merge_key:
+            operation = self.mailbox[-1]
+            operation.count += 1
+            return operation.future
+
+        if bounded and len(self.mailbox) >= self.mailbox_size:
+            raise MailboxFull()
+
+        operation = _Operation(func, merge_key, asyncio.get_running_loop().create_future(), log_context.get())
+        self.mailbox.append(operation)
+        if self._task is None or self._task.done():
+            self._task = spawn(self._run(), guild=self.guild_id)
+        return operation.future
+
+    async def _run(self):
+        try:
+            while self.mailbox:
+                operation = self.mailbox.popleft()
+                # Each operation logs as the command or event that submitted it
+                log_context.set({**operation.log_fields, 'guild': self.guild_id})
+                try:
+                    result = await (operation.func(operation.count) if operation.merge_key else operation.func())
+                except asyncio.CancelledError:
+                    operation.future.cancel()
+                    raise
+                except Exception as e:
+                    logger.error(f"Error in guild {self.guild_id} operation: {e}", exc_info=True)
+                    if not operation.future.done():
+                        operation.future.set_exception(e)
+                        operation.future.exception()  # Don't warn if nobody awaits it
+                else:
+                    if not operation.future.done():
+                        operation.future.set_result(result)
+        finally:
+            if not self.mailbox:
+                self._on_idle(self.guild_id)
+
+    def cancel(self):
+        for operation in self.mailbox:
+            operation.future.cancel()
+        self.mailbox.clear()
+        if self._task:
+            self._task.cancel()
+
+
+class GuildActors:
+    """Per-guild actors, created on demand and dropped once their mailbox is empty"""
+
+    def __init__(self, mailbox_size: int = 16):
+        self.mailbox_size = mailbox_size
+        self._actors = {}  # Guild ID: GuildActor
+
+    def __len__(self):
+        return len(self._actors)
+
+    def submit(self, guild_id: int, func: Callable[..., Awaitable], merge_key: Optional[str] = None,
+               bounded: bool = True) -> asyncio.Future:
+        """Queue an operation for the guild
+
+        Operations with a merge_key are called with the number of merged
+        requests, others with no arguments. Raises MailboxFull when the
+        guild has mailbox_size operations waiting, unless bounded is False
+        (used for Lavalink events that must never be dropped).
+        """
+        actor = self._actors.get(guild_id)
+        if actor is None:
+            actor = self._actors[guild_id] = GuildActor(guild_id, self.mailbox_size, self._remove)
+        return actor.submit(func, merge_key, bounded)
+
+    def _remove(self, guild_id: int):
+        actor = self._actors.get(guild_id)
+        if actor is not None and not actor.mailbox:
+            del self._actors[guild_id]
+
+    def cancel_all(self):
+        for actor in list(self._actors.values()):
+            actor.cancel()
+        self._actors.clear()
@@ -0,0 +1,251 @@
+import random
+from itertools import islice
+from typing import Optional
+
+import wavelink
+
+
+class TrackRecord:
+    """Lightweight queue entry, only turned into a wavelink.Playable when it's about to play"""
+
+    __slots__ = ('encoded', 'title', 'length', 'identifier', 'uri', 'requester', 'seq')
+
+    def __init__(self, encoded: str, title: str, length: int, identifier: str = "",
+                 uri: Optional[str] = None, requester: Optional[int] = None):
+        self.encoded = encoded
+        self.title = title
+        self.length = length
+        self.identifier = identifier
+        self.uri = uri
+        self.requester = requester  # User ID, not the Member object
+        self.seq: Optional[float] = None  # Sort key of the entry's row in the queue store
+
+    def __repr__(self) -> str:
+        return f"TrackRecord(title={self.title!r}, length={self.length})"
+
+    @classmethod
+    def from_playable(cls, track: wavelink.Playable, requester: Optional[int] = None) -> 'TrackRecord':
+        return cls(
+            encoded=track.encoded,
+            title=track.title,
+            length=track.length,
+            identifier=track.identifier,
+            uri=track.uri,
+            requester=requester
+        )
+
+    def to_playable(self) -> wavelink.Playable:
+        # Lavalink only needs the encoded string to play, the info is for display
+        return wavelink.Playable(data={
+            "encoded": self.encoded,
+            "info": {
+                "identifier": self.identifier,
+                "isSeekable": True,
+                "author": "",
+                "length": self.length,
+                "isStream": False,
+                "position": 0,
+                "title": self.title,
+                "uri": self.uri,
+                "sourceName": "",
+            },
+            "pluginInfo": {},
+        })
+
+
+class _Fenwick:
+    """Prefix sums over a fixed number of slots, O(log n) updates and queries"""
+
+    def __init__(self, values: list):
+        self._tree = [0] + list(values)
+        size = len(values)
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                self._tree[parent] += self._tree[index]
+
+    def add(self, slot: int, delta: int) -> None:
+        index = slot + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, slot: int) -> int:
+        """Sum of slots [0, slot)"""
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def search(self, target: int) -> tuple:
+        """First slot whose running total exceeds target, and how far into that slot target is"""
+        slot = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            index = slot + step
+            if index < len(self._tree) and self._tree[index] <= target:
+                slot = index
+                target -= self._tree[index]
+            step >>= 1
+        return slot, target
+
+
+class GuildQueue:
+    """Per-guild queue of TrackRecords, indexed by position and by running time
+
+    Records live in blocks of up to 2 * BLOCK_SIZE, with Fenwick trees over
+    the block sizes and block durations. Finding a position, removing,
+    inserting, moving and "when does entry i start" are all O(log n) plus a
+    small per-block constant, so queues with thousands of entries stay cheap.
+    """
+
+    BLOCK_SIZE = 128
+
+    def __init__(self):
+        self._blocks = [[]]
+        self._size = 0
+        self._reindex()
+        self.on_change = None  # Called as on_change(op, *args) after every mutation, used for persistence
+        self.version = 0  # Bumped on every mutation, lets views cache rendered pages
+
+    def _changed(self, op: str, *args):
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(op, *args)
+
+    def _reindex(self) -> None:
+        self._counts = _Fenwick([len(block) for block in self._blocks])
+        self._lengths = _Fenwick([sum(track.length for track in block) for block in self._blocks])
+
+    def _split(self, block_index: int) -> None:
+        block = self._blocks[block_index]
+        if len(block) <= 2 * self.BLOCK_SIZE:
+            return
+        self._blocks[block_index:block_index + 1] = [
+            block[start:start + self.BLOCK_SIZE] for start in range(0, len(block), self.BLOCK_SIZE)
+        ]
+        self._reindex()
+
+    def _locate(self, index: int) -> tuple:
+        """(block index, offset in block) of a queue position"""
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("queue index out of range")
+        return self._counts.search(index)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def __getitem__(self, index: int) -> TrackRecord:
+        block_index, offset = self._locate(index)
+        return self._blocks[block_index][offset]
+
+    @property
+    def total_length(self) -> int:
+        """Milliseconds of audio in the queue"""
+        return self._lengths.prefix(len(self._blocks))
+
+    def start_offset(self, index: int) -> int:
+        """Milliseconds of queued audio before the entry at index starts"""
+        block_index, offset = self._locate(index)
+        return self._lengths.prefix(block_index) + sum(track.length for track in self._blocks[block_index][:offset])
+
+    def _insert(self, index: int, track: TrackRecord) -> None:
+        if index >= self._size:
+            block_index, offset = len(self._blocks) - 1, len(self._blocks[-1])
+        else:
+            block_index, offset = self._locate(max(index, 0))
+        self._blocks[block_index].insert(offset, track)
+        self._size += 1
+        self._counts.add(block_index, 1)
+        self._lengths.add(block_index, track.length)
+        self._split(block_index)
+
+    def _pop(self, index: int) -> TrackRecord:
+        block_index, offset = self._locate(index)
+        block = self._blocks[block_index]
+        track = block.pop(offset)
+        self._size -= 1
+        if not block and len(self._blocks) > 1:
+            del self._blocks[block_index]
+            self._reindex()
+        else:
+            self._counts.add(block_index, -1)
+            self._lengths.add(block_index, -track.length)
+        return track
+
+    def append(self, track: TrackRecord) -> None:
+        self._insert(self._size, track)
+        self._changed('append', [track])
+
+    def extend(self, tracks) -> None:
+        tracks = list(tracks)
+        if not tracks:
+            return
+        self._blocks[-1].extend(tracks)
+        self._size += len(tracks)
+        # Rebuilds the index once for the whole batch
+        last = self._blocks.pop()
+        self._blocks.extend(last[start:start + self.BLOCK_SIZE] for start in range(0, len(last), self.BLOCK_SIZE))
+        self._reindex()
+        self._changed('append', tracks)
+
+    def popleft(self) -> TrackRecord:
+        track = self._pop(0)
+        self._changed('remove', track)
+        return track
+
+    def remove_at(self, index: int) -> TrackRecord:
+        track = self._pop(index)
+        self._changed('remove', track)
+        return track
+
+    def move(self, source: int, destination: int) -> TrackRecord:
+        """Move the entry at source so it ends up at position destination"""
+        track = self._pop(source)
+        destination = min(max(destination, 0), self._size)
+        self._insert(destination, track)
+        self._changed('move', track, destination)
+        return track
+
+    def shuffle(self, rng: random.Random = random) -> None:
+        """In place Fisher-Yates shuffle, the records are swapped where they are"""
+        for index in range(self._size - 1, 0, -1):
+            other = rng.randint(0, index)
+            if other == index:
+                continue
+            block_a, offset_a = self._locate(index)
+            block_b, offset_b = self._locate(other)
+            track_a, track_b = self._blocks[block_a][offset_a], self._blocks[block_b][offset_b]
+            self._blocks[block_a][offset_a], self._blocks[block_b][offset_b] = track_b, track_a
+            if block_a != block_b:
+                self._lengths.add(block_a, track_b.length - track_a.length)
+                self._lengths.add(block_b, track_a.length - track_b.length)
+        self._changed('reset')
+
+    def page(self, start: int, stop: int) -> list:
+        if start >= self._size:
+            return []
+        block_index, offset = self._locate(start)
+        tracks = []
+        for block in self._blocks[block_index:]:
+            tracks.extend(islice(block, offset, offset + stop - start - len(tracks)))
+            offset = 0
+            if len(tracks) >= stop - start:
+                break
+        return tracks
+
+    def clear(self) -> None:
+        self._blocks = [[]]
+        self._size = 0
+        self._reindex()
+        self._changed('reset')
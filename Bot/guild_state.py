@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from guild_queue import GuildQueue
+
+
+logger = logging.getLogger('MusicBot')
+
+
+class GuildState:
+    """Everything the music cog keeps for one guild, so it can be dropped in one go"""
+
+    __slots__ = ('guild_id', 'queue', 'command_channel_id', 'voice_channel_id', 'human_count',
+                 'alone_timer', 'now_playing', 'now_playing_key', 'ingest_task', 'last_used')
+
+    def __init__(self, guild_id: int, queue: GuildQueue):
+        self.guild_id = guild_id
+        self.queue = queue
+        self.command_channel_id: Optional[int] = None  # Where notices go, an ID so no channel object is pinned
+        self.voice_channel_id: Optional[int] = None  # Bot's voice channel
+        self.human_count = 0  # Humans in the bot's voice channel
+        self.alone_timer: Optional[asyncio.TimerHandle] = None
+        self.now_playing = None  # Now playing panel message
+        self.now_playing_key: Optional[tuple] = None  # (title, length) currently rendered on the panel
+        self.ingest_task: Optional[asyncio.Task] = None  # Adding a playlist to the queue
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self.alone_timer:
+            self.alone_timer.cancel()
+            self.alone_timer = None
+        if self.ingest_task:
+            self.ingest_task.cancel()
+            self.ingest_task = None
+
+
+class GuildStates:
+    """Per-guild state, created on first use and released on disconnect
+
+    Guilds that touched the bot once and never came back would otherwise
+    stay forever, so states unused for idle_ttl seconds, or the least
+    recently used ones past max_guilds, are evicted. is_active guards
+    guilds that are still connected to voice, those are never evicted.
+    """
+
+    def __init__(self, load_queue: Callable[[int], GuildQueue], on_release: Callable[[GuildState], None],
+                 is_active: Callable[[GuildState], bool], max_guilds: int = 10000, idle_ttl: float = 3600,
+                 sweep_interval: float = 60):
+        self.load_queue = load_queue
+        self.on_release = on_release
+        self.is_active = is_active
+        self.max_guilds = max_guilds
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._states = OrderedDict()  # Guild ID: GuildState, least recently used first
+        self._last_sweep = time.monotonic()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def values(self):
+        return self._states.values()
+
+    def get(self, guild_id: int) -> GuildState:
+        """The guild's state, created (and its queue restored) if it isn't resident"""
+        now = time.monotonic()
+        state = self._states.get(guild_id)
+        if state is None:
+            self._evict(now)
+            state = self._states[guild_id] = GuildState(guild_id, self.load_queue(guild_id))
+        else:
+            self._states.move_to_end(guild_id)
+        state.last_used = now
+        return state
+
+    def peek(self, guild_id: int) -> Optional[GuildState]:
+        """The guild's state if resident, without creating it or counting as use"""
+        return self._states.get(guild_id)
+
+    def release(self, guild_id: int) -> None:
+        state = self._states.pop(guild_id, None)
+        if state is not None:
+            state.close()
+            self.on_release(state)
+
+    def release_all(self) -> None:
+        for guild_id in list(self._states):
+            self.release(guild_id)
+
+    def _evict(self, now: float) -> None:
+        # Make room for the state about to be added
+        over = len(self._states) + 1 - self.max_guilds
+        if over <= 0 and now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+
+        expired = []
+        for guild_id, state in self._states.items():
+            if over <= 0 and now - state.last_used < self.idle_ttl:
+                break  # Ordered by last use, the rest are fresher
+            if not self.is_active(state):
+                expired.append(guild_id)
+                over -= 1
+        for guild_id in expired:
+            self.release(guild_id)
+        if expired:
+            self.evicted += len(expired)
+            logger.info(f"Evicted {len(expired)} inactive guild states, {len(self._states)} resident")
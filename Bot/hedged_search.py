@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+from admission import Busy, Lane
+from metrics import SEARCH_HEDGES
+
+
+logger = logging.getLogger('MusicBot')
+
+_HEDGE_WON_PRIMARY = SEARCH_HEDGES.labels('primary')
+_HEDGE_WON_SECONDARY = SEARCH_HEDGES.labels('secondary')
+_HEDGE_WON_NONE = SEARCH_HEDGES.labels('none')
+
+
+class HedgedSearch:
+    """Text searches that fall back to a second source when the first is slow
+
+    The query goes to the primary source (ytsearch) first. If no acceptable
+    result has come back after the hedge delay, or the primary fails or
+    only finds tracks play would refuse, the same query also goes to the
+    secondary source. The first acceptable result wins and the other
+    request is cancelled. The hedge delay follows a high percentile of the
+    primary's recent latency, so only its slow tail pays for a second
+    request. Without a secondary source this is a plain cached search.
+    """
+
+    def __init__(self, search_cache, max_length: int, primary: str = 'ytsearch', secondary: Optional[str] = 'scsearch',
+                 quantile: float = 0.9, initial_delay: float = 0.5, min_delay: float = 0.1, max_delay: float = 2.0,
+                 window: int = 200):
+        self.search_cache = search_cache
+        self.max_length = max_length
+        self.primary = primary
+        self.secondary = secondary
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latencies = deque(maxlen=window)  # Recent primary round trips in seconds, sets the hedge delay
+
+    @property
+    def hedge_delay(self) -> float:
+        samples = self.latencies
+        if len(samples) < 20:
+            return self.initial_delay
+        ordered = sorted(samples)
+        delay = ordered[min(int(len(ordered) * self.quantile), len(ordered) - 1)]
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def acceptable(self, tracks) -> bool:
+        """Whether play could use the result as is"""
+        if not tracks or not isinstance(tracks, list):
+            return False
+        return not tracks[0].is_stream and tracks[0].length <= self.max_length
+
+    async def _fetch(self, source: str, text: str):
+        query = f"{source}:{text}"
+        # Only the primary's own round trips count: cache hits and joined requests say nothing
+        # about it, and the secondary's latency has no say in when to hedge
+        if source != self.primary or self.search_cache.resolving(query):
+            return await self.search_cache.fetch_tracks(query, Lane.INTERACTIVE)
+
+        started = time.monotonic()
+        try:
+            result = await self.search_cache.fetch_tracks(query, Lane.INTERACTIVE)
+        except Busy:
+            raise  # Waited for a slot, not for the source
+        except (asyncio.CancelledError, Exception):
+            # Cancelled as the loser or failed: it took at least this long, which keeps the
+            # percentile from only ever seeing the fast requests
+            self.latencies.append(time.monotonic() - started)
+            raise
+        self.latencies.append(time.monotonic() - started)
+        return result
+
+    async def search(self, text: str):
+        """Tracks for a text query, from whichever source answered acceptably first"""
+        if not self.secondary:
+            return await self.search_cache.fetch_tracks(f"{self.primary}:{text}", Lane.INTERACTIVE)
+
+        # Either source resolved it before, no race needed
+        for source in (self.primary, self.secondary):
+            result = self.search_cache.cached(f"{source}:{text}")
+            if self.acceptable(result):
+                return result
+
+        primary = asyncio.create_task(self._fetch(self.primary, text))
+        secondary = None
+        pending = {primary}
+        outcomes = {}  # Task: result or exception, for when neither source is acceptable
+        try:
+            delay = self.hedge_delay
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if secondary else delay,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Busy:
+                        if task is primary:
+                            raise  # Lavalink is shedding load, a second request won't help
+                        continue
+                    except Exception as e:
+                        outcomes[task] = e
+                        continue
+                    if self.acceptable(result):
+                        if secondary is not None:
+                            (_HEDGE_WON_PRIMARY if task is primary else _HEDGE_WON_SECONDARY).inc()
+                        return result
+                    outcomes[task] = result
+
+                if secondary is None:
+                    # Primary is slow, failed or came back unusable
+                    secondary = asyncio.create_task(self._fetch(self.secondary, text))
+                    pending.add(secondary)
+        finally:
+            for task in (primary, secondary):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        _HEDGE_WON_NONE.inc()
+        # Nothing usable, answer like an unhedged search would
+        outcome = outcomes[primary]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
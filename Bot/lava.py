@@ -1,25 +1,68 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import wavelink
 import os
 from dotenv import load_dotenv
 import asyncio
 import logging
+import time
+import hmac
+import io
+import random
+import threading
+from functools import lru_cache
 from discord.ui import Button, View
 from typing import Optional
-import datetime
 from discord import Embed, Color
 from aiohttp import web
-from datetime import datetime, timedelta
-from discord.ext import commands, tasks
-
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+from track_cache import SearchCache
+from hedged_search import HedgedSearch
+from track_store import TrackStore
+from guild_queue import GuildQueue, TrackRecord
+from title_index import MAX_CHOICE_LENGTH, TitleIndex
+from guild_actor import GuildActors, MailboxFull
+from guild_state import GuildState, GuildStates
+from queue_store import QueueStore
+from outbox import Outbox
+from queue_export import dump_queue, load_queue
+import metrics
+from metrics import COMMAND_LATENCY, INTERACTION_LATENCY, Children
+import discord_http
+from profiling import LoopLagMonitor, SamplingProfiler
+from nodes import BalancedPlayer, balancer, load_nodes_from_env, node_penalty
+from admission import Busy, Lane, admission
+from resume import ResumeState
+from autoplay import Autoplay
+from ratelimit import CommandLimiter
+import log_setup
+from log_setup import log_context, setup_logging, spawn
+
+
+# Set up logging, written from a background thread so slow output never stalls the loop
+setup_logging()
 logger = logging.getLogger('MusicBot')
 
 load_dotenv()
 
+MAX_TRACK_LENGTH = 600000  # 10 minutes in milliseconds
+IMPORT_MAX_TRACKS = int(os.getenv('IMPORT_MAX_TRACKS', 1000))  # Tracks read from one !import file
+IMPORT_MAX_BYTES = 1024 * 1024  # Largest !import file, compressed or not
+PLAYLIST_CHUNK_SIZE = 100  # Tracks added to the queue per step when loading playlists
+PROGRESS_EDIT_INTERVAL = 2  # Seconds between playlist progress message edits
+
+cluster_link = None  # ClusterLink to the supervisor when started from cluster.py
+process_started = time.monotonic()
+startup_phases = {}  # Phase name: seconds it took, logged and exported on /metrics
+# One file per cluster worker, each has its own Lavalink sessions
+resume_state = ResumeState(os.getenv('RESUME_STATE_PATH', f"lavalink_resume_{os.getenv('CLUSTER_ID', 0)}.json"))
+lag_monitor = LoopLagMonitor(block_threshold=float(os.getenv('LOOP_BLOCK_THRESHOLD', 0.5)))
+profiler = SamplingProfiler(max_duration=float(os.getenv('PROFILER_MAX_SECONDS', 60)))
+command_limiter = CommandLimiter.from_env()
+# Latency children by command name, looked up once per command
+command_latency = Children(COMMAND_LATENCY)
+interaction_latency = Children(INTERACTION_LATENCY)
+
 
 def format_duration(milliseconds: float) -> str:
     """Format duration from milliseconds to a readable string"""
@@ -36,102 +79,378 @@ def format_duration(milliseconds: float) -> str:
     else:
         return f"{minutes}:{seconds:02d}"
 
-class MusicBot(commands.Bot):
+def format_queued_notice(titles: list) -> str:
+    """Merge a burst of "Added to queue" notices into one message"""
+    if len(titles) == 1:
+        return f"📑 Added to queue: **{titles[0]}**"
+    text = f"📑 Added {len(titles)} tracks to queue: " + ", ".join(f"**{title}**" for title in titles)
+    return text if len(text) <= 2000 else text[:1997] + "..."
+
+@lru_cache(maxsize=512)
+def now_playing_embed(title: str, length: int) -> discord.Embed:
+    """Build (once per track) the embed shown on the now playing panel"""
+    embed = discord.Embed(
+        title="🎵 Now Playing",
+        description=f"**{title}**",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="Duration", value=format_duration(length))
+    return embed
+
+def record_phase(phase: str, started: float) -> None:
+    startup_phases[phase] = time.monotonic() - started
+    logger.info(f"Startup: {phase} took {startup_phases[phase]:.2f}s")
+
+
+class BackendWarmingUp(commands.CheckFailure):
+    """No Lavalink node is connected yet (or right now)"""
+
+
+def audio_backend_ready():
+    """Command check that fails fast while no Lavalink node is connected"""
+    async def predicate(ctx: commands.Context) -> bool:
+        if not balancer.healthy_nodes():
+            raise BackendWarmingUp()
+        return True
+    return commands.check(predicate)
+
+
+async def admit_interaction(interaction: discord.Interaction, command: str) -> bool:
+    """Rate limit a slash command or button press, only the first rejection in a while is explained"""
+    # Runs in the interaction's own task, the check and the callback both log with this
+    log_context.set({'guild': interaction.guild_id, 'command': command, 'user': interaction.user.id})
+    retry_after = command_limiter.admit(command, interaction.user.id, interaction.guild_id)
+    if not retry_after:
+        return True
+
+    if command_limiter.should_notify(interaction.user.id):
+        await interaction.response.send_message(
+            f"⏳ You're going too fast, try again in {retry_after:.0f}s.", ephemeral=True
+        )
+    elif interaction.type is discord.InteractionType.component:
+        # Acknowledge quietly so the button doesn't show "interaction failed"
+        await interaction.response.defer()
+    else:
+        # A slash command needs some answer or Discord reports it as failed, only the invoker sees this one
+        await interaction.response.send_message(f"⏳ Still rate limited, try again in {retry_after:.0f}s.", ephemeral=True)
+    return False
+
+
+def time_interaction(name: str) -> None:
+    """Time the rest of the current interaction, called from its check
+
+    discord.py runs each slash command (checks, callback, error handlers)
+    and each component press in a task of its own, so the interaction is
+    done when that task is.
+    """
+    started = time.perf_counter()
+    latency = interaction_latency[name]
+    task = asyncio.current_task()
+    if task is not None:
+        task.add_done_callback(lambda _: latency.observe(time.perf_counter() - started))
+
+
+class RateLimitedTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Autocomplete fires per keystroke and is served from memory, only the command itself counts
+        if interaction.type is discord.InteractionType.autocomplete:
+            return True
+        command = interaction.command.qualified_name if interaction.command else 'default'
+        if not await admit_interaction(interaction, command):
+            return False
+        time_interaction(command)
+        return True
+
+
+class MusicBot(commands.AutoShardedBot):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix='!', intents=intents)
 
-    async def setup_hook(self) -> None:
+        # Set by cluster.py when running as one worker of a multi-process cluster
+        shard_options = {}
+        if os.getenv('SHARD_COUNT'):
+            shard_options['shard_count'] = int(os.getenv('SHARD_COUNT'))
+        if os.getenv('SHARD_IDS'):
+            shard_options['shard_ids'] = [int(shard_id) for shard_id in os.getenv('SHARD_IDS').split(',')]
+
+        super().__init__(command_prefix='!', intents=intents, tree_cls=RateLimitedTree, **shard_options)
+
+    async def invoke(self, ctx: commands.Context) -> None:
+        if ctx.command and not await self._admit(ctx):
+            return
+
+        # Time every command for the /metrics endpoint
+        started = time.perf_counter()
+        # Every log line from this command (and tasks it starts) carries these
+        token = log_context.set({
+            'guild': ctx.guild.id if ctx.guild else None,
+            'command': ctx.command.qualified_name if ctx.command else None,
+            'user': ctx.author.id,
+        })
         try:
-            nodes = [
-                wavelink.Node(
-                    uri=f'https://{os.getenv("LAVALINK_HOST")}:{os.getenv("LAVALINK_PORT")}',
-                    password=os.getenv('LAVALINK_PASSWORD', 'youshallnotpass')
-                )
-            ]
-            await wavelink.Pool.connect(nodes=nodes, client=self)
-            logger.info(f"Successfully connected to Lavalink")
-        except Exception as e:
-            logger.error(f"Failed to connect to Lavalink: {e}")
-            raise
+            await super().invoke(ctx)
+        finally:
+            log_context.reset(token)
+            if ctx.command:
+                command_latency[ctx.command.qualified_name].observe(time.perf_counter() - started)
+
+    async def _admit(self, ctx: commands.Context) -> bool:
+        """Rate limit a prefix command, only the first rejection in a while gets a reply"""
+        retry_after = command_limiter.admit(ctx.command.qualified_name, ctx.author.id, ctx.guild.id if ctx.guild else None)
+        if not retry_after:
+            return True
+        if command_limiter.should_notify(ctx.author.id):
+            await ctx.send(f"⏳ {ctx.author.mention}, you're going too fast, try again in {retry_after:.0f}s.",
+                           delete_after=10)
+        return False
+
+    async def setup_hook(self) -> None:
+        started = time.monotonic()
+        lag_monitor.start()
+        discord_http.instrument(self)
+        # Cogs load once here, not in on_ready which runs again on every reconnect
+        await self.add_cog(Music(self))
+        record_phase("cogs", started)
+
+        # Login doesn't wait for Lavalink, commands say it's warming up until a node connects
+        self.lavalink_task = asyncio.create_task(self.connect_lavalink())
+
+    async def connect_lavalink(self) -> None:
+        started = time.monotonic()
+        nodes = load_nodes_from_env()
+        resume_state.load()
+        resume_state.apply_sessions(nodes)
+        await asyncio.gather(*(self._connect_node(node) for node in nodes))
+        balancer.start()
+        record_phase("lavalink", started)
+        logger.info(f"Successfully connected to Lavalink ({len(nodes)} nodes)")
+
+    async def close(self) -> None:
+        # Disconnecting would destroy the players on Lavalink, leave them for the next process to resume
+        for vc in list(self.voice_clients):
+            self._connection._remove_voice_client(vc.guild.id)
+        resume_state.save_now()
+        await super().close()
+
+    async def _connect_node(self, node: wavelink.Node) -> None:
+        """Connect one node, retrying with jittered exponential backoff
+
+        wavelink already retries refused/dropped websockets itself, this
+        covers the handshakes it gives up on (e.g. 401/404 while Lavalink
+        or its proxy is still starting).
+        """
+        attempt = 0
+        while True:
+            try:
+                await wavelink.Pool.connect(nodes=[node], client=self)
+            except Exception as e:
+                logger.error(f"Failed to connect to Lavalink node {node.identifier}: {e}")
+            if node.identifier in wavelink.Pool.nodes:
+                return
+
+            # Full jitter, so restarted workers don't all retry in lockstep
+            delay = random.uniform(0, min(60, 2 ** attempt))
+            attempt += 1
+            logger.warning(f"Lavalink node {node.identifier} not connected, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
 class Music(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.queue = {}  # Guild ID: List[Track]
-        self.alone_since = {}  # Guild ID: Time
-        self.check_alone.start()
-        self.command_channels = {}  # Guild ID: Text Channel
-        self.skip_flags = {}  # Add this to track skip states
+        self.alone_timeout = int(os.getenv('ALONE_TIMEOUT', 300))
+        # Player/queue changes for a guild run one at a time through its actor
+        self.actors = GuildActors(mailbox_size=int(os.getenv('GUILD_MAILBOX_SIZE', 16)))
+        self.control_view = MusicControlView()  # Shared, stateless, reused by every panel
+        self.outbox = Outbox(merge_window=float(os.getenv('OUTBOX_MERGE_WINDOW', 0.3)))
+        self.outbox.register_merge("queued", format_queued_notice)
+        self.queue_store = QueueStore(
+            path=os.getenv('QUEUE_DB_PATH', 'queues.db'),
+            flush_interval=float(os.getenv('QUEUE_FLUSH_INTERVAL', 2))
+        )
+        # Queue, channels, idle timer and panel of each guild, dropped on disconnect or when idle
+        self.guilds = GuildStates(
+            load_queue=self.queue_store.load,
+            on_release=self._release_guild,
+            is_active=self._guild_active,
+            max_guilds=int(os.getenv('GUILD_STATE_MAX', 10000)),
+            idle_ttl=float(os.getenv('GUILD_STATE_TTL', 3600))
+        )
+        # Resolved tracks on disk, so songs played before skip Lavalink even after a restart
+        self.track_store = TrackStore(
+            path=os.getenv('TRACK_STORE_PATH', 'tracks.db'),
+            max_entries=int(os.getenv('TRACK_STORE_SIZE', 20000)),
+            max_age=float(os.getenv('TRACK_STORE_MAX_AGE', 7 * 86400))
+        )
+        # Shared across guilds so popular songs only hit Lavalink once
+        self.search_cache = SearchCache(
+            max_size=int(os.getenv('SEARCH_CACHE_SIZE', 1024)),
+            ttl=float(os.getenv('SEARCH_CACHE_TTL', 3600)),
+            store=self.track_store
+        )
+        # Text searches race a second source when the first one is slow (SEARCH_HEDGE_SOURCE= turns it off)
+        self.searcher = HedgedSearch(
+            self.search_cache,
+            max_length=MAX_TRACK_LENGTH,
+            primary=os.getenv('SEARCH_SOURCE', 'ytsearch'),
+            secondary=os.getenv('SEARCH_HEDGE_SOURCE', 'scsearch') or None,
+            quantile=float(os.getenv('SEARCH_HEDGE_QUANTILE', 0.9)),
+            initial_delay=float(os.getenv('SEARCH_HEDGE_DELAY', 0.5))
+        )
+        # Related tracks kept ready for when a guild's queue runs out (!autoplay)
+        self.autoplay = Autoplay(
+            self.search_cache,
+            max_length=MAX_TRACK_LENGTH,
+            buffer_size=int(os.getenv('AUTOPLAY_BUFFER', 3)),
+            threshold=int(os.getenv('AUTOPLAY_THRESHOLD', 2)),
+            default_enabled=os.getenv('AUTOPLAY_DEFAULT', 'false').lower() == 'true',
+            on_filled=self._autoplay_filled
+        )
+        # Tracks already played, for /play autocomplete without a Lavalink round trip
+        self.title_index = TitleIndex(max_tracks=int(os.getenv('TITLE_INDEX_SIZE', 5000)))
         logger.info("Music cog initialized")
 
-    def cog_unload(self):
-        self.check_alone.cancel()  # Cancel the task when cog is unloaded
+    async def cog_load(self):
+        # One persistent view handles the buttons on every now playing panel, even after restarts
+        self.bot.add_view(self.control_view)
+        self.queue_store.start()
+        await self.track_store.warm()
+        self.track_store.start()
+
+    async def cog_unload(self):
+        # Cancel pending idle disconnects and playlist ingestion, queues stay on disk
+        self.guilds.release_all()
+        self.actors.cancel_all()
+        # Write out whatever changed since the last flush
+        await self.queue_store.close()
+        await self.track_store.close()
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        # A guild's first command reads its saved queue in a thread, not on the loop in get_queue
+        if ctx.guild and self.guilds.peek(ctx.guild.id) is None:
+            await self.queue_store.prefetch(ctx.guild.id)
+            self.guilds.get(ctx.guild.id)
+
+    def get_queue(self, guild_id: int) -> GuildQueue:
+        # Restored lazily from the last snapshot the first time a guild is touched
+        return self.guilds.get(guild_id).queue
+
+    def _guild_active(self, state: GuildState) -> bool:
+        """Connected to voice or still adding a playlist, such guilds are never evicted"""
+        guild = self.bot.get_guild(state.guild_id)
+        if guild is not None and guild.voice_client:
+            return True
+        return state.ingest_task is not None and not state.ingest_task.done()
+
+    def _release_guild(self, state: GuildState):
+        # The queue snapshot stays on disk and is restored if the guild comes back
+        self.queue_store.detach(state.guild_id)
+        self.autoplay.discard(state.guild_id)
+        self.title_index.release(state.guild_id)
+
+    def end_session(self, guild_id: int):
+        """Clear the queue and drop everything kept for the guild, after the bot was told to leave"""
+        self.get_queue(guild_id).clear()
+        self.guilds.release(guild_id)
+
+    def set_command_channel(self, guild_id: int, channel: discord.abc.Messageable):
+        self.guilds.get(guild_id).command_channel_id = channel.id
+
+    def _command_channel(self, guild: discord.Guild) -> Optional[discord.abc.Messageable]:
+        """The last channel music commands were used in, None if unknown or gone"""
+        state = self.guilds.peek(guild.id)
+        if state is None or state.command_channel_id is None:
+            return None
+        return guild.get_channel_or_thread(state.command_channel_id)
+
+    def _update_human_count(self, guild: discord.Guild, delta: int):
+        """Adjust the number of humans in the bot's channel, arming/cancelling the idle timer on 0"""
+        state = self.guilds.get(guild.id)
+        state.human_count = max(state.human_count + delta, 0)
+
+        if state.human_count == 0:
+            self._arm_alone_timer(guild, state)
+        else:
+            self._cancel_alone_timer(state)
+
+    def _arm_alone_timer(self, guild: discord.Guild, state: GuildState):
+        if state.alone_timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+        state.alone_timer = loop.call_later(
+            self.alone_timeout,
+            lambda: spawn(self._disconnect_if_alone(guild.id), guild=guild.id)
+        )
+        logger.info(f"Bot is alone in {guild.name}, starting timer")
+
+    def _cancel_alone_timer(self, state: GuildState):
+        if state.alone_timer is not None:
+            state.alone_timer.cancel()
+            state.alone_timer = None
 
-    # Add this new task to check for alone status
-    @tasks.loop(seconds=30)  # Check every 30 seconds
-    async def check_alone(self):
+    async def _disconnect_if_alone(self, guild_id: int):
         try:
-            for guild in self.bot.guilds:
-                if guild.voice_client:
-                    vc = guild.voice_client
-                    channel = vc.channel
-                    
-                    # Count members (excluding bots)
-                    members = [m for m in channel.members if not m.bot]
-                    
-                    if not members:  # Bot is alone
-                        if guild.id not in self.alone_since:
-                            self.alone_since[guild.id] = datetime.now()
-                            logger.info(f"Bot is alone in {guild.name}, starting timer")
-                    else:
-                        # Reset timer if not alone
-                        self.alone_since.pop(guild.id, None)
-                        
-                    # Check if bot has been alone for more than 5 minutes
-                    if guild.id in self.alone_since:
-                        alone_time = datetime.now() - self.alone_since[guild.id]
-                        if alone_time > timedelta(minutes=5):
-                            logger.info(f"Bot has been alone for 5 minutes in {guild.name}, disconnecting")
-                            await vc.disconnect()
-                            if guild.id in self.queue:
-                                self.queue[guild.id].clear()
-                            self.alone_since.pop(guild.id)
-                            
-                            # Send message to the last used command channel
-                            if guild.id in self.command_channels:
-                                channel = self.command_channels[guild.id]
-                                await channel.send("👋 Left voice channel due to inactivity (no users present for 5 minutes)")
-        except Exception as e:
-            logger.error(f"Error in check_alone task: {e}")
+            state = self.guilds.peek(guild_id)
+            if state is None:
+                return  # Released since the timer was armed
+            state.alone_timer = None
+            guild = self.bot.get_guild(guild_id)
+            if not guild or not guild.voice_client or state.human_count > 0:
+                return
+            # The running count can drift (a re-identify rebuilds voice states without events), so look once
+            humans = sum(1 for m in guild.voice_client.channel.members if not m.bot)
+            if humans:
+                state.human_count = humans
+                return
 
-    @check_alone.before_loop
-    async def before_check_alone(self):
-        await self.bot.wait_until_ready()
+            logger.info(f"Bot has been alone for {self.alone_timeout}s in {guild.name}, disconnecting")
+            # Look the channel up before the state is released
+            channel = self._command_channel(guild)
+            await guild.voice_client.disconnect()
+            self.end_session(guild_id)
+
+            # Send message to the last used command channel
+            if channel:
+                self.outbox.send(channel, f"👋 Left voice channel due to inactivity (no users present for {self.alone_timeout // 60} minutes)")
+        except Exception as e:
+            logger.error(f"Error in idle disconnect: {e}")
 
     # Add this to handle voice state updates
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         try:
-            if member.bot:  # Ignore bot voice state changes
+            if before.channel == after.channel:  # Mute/deafen etc, nobody moved
+                return
+
+            guild = member.guild
+            log_context.set({'guild': guild.id, 'user': member.id})
+
+            if member.id == self.bot.user.id:
+                if after.channel:
+                    # Bot joined or moved, count once and track incrementally from here
+                    state = self.guilds.get(guild.id)
+                    state.voice_channel_id = after.channel.id
+                    state.human_count = 0
+                    self._update_human_count(guild, sum(1 for m in after.channel.members if not m.bot))
+                    resume_state.set_player(guild.id, after.channel.id, state.command_channel_id)
+                else:
+                    # Bot left, drop everything for this guild (the queue stays on disk)
+                    self.guilds.release(guild.id)
+                    resume_state.remove_player(guild.id)
+                return
+
+            if member.bot:  # Ignore other bots
                 return
 
-            if before.channel:
-                guild = before.channel.guild
-                if guild.voice_client and guild.voice_client.channel == before.channel:
-                    # Check if bot is now alone
-                    members = [m for m in before.channel.members if not m.bot]
-                    if not members:
-                        self.alone_since[guild.id] = datetime.now()
-                        logger.info(f"Bot is now alone in {guild.name}")
-
-            if after.channel:
-                guild = after.channel.guild
-                if guild.voice_client and guild.voice_client.channel == after.channel:
-                    # Reset timer if someone joined
-                    self.alone_since.pop(guild.id, None)
-                    logger.info(f"Someone joined bot's channel in {guild.name}")
+            # Guilds the bot isn't in voice in don't get a state just for this
+            state = self.guilds.peek(guild.id)
+            if state is None or state.voice_channel_id is None:
+                return
+
+            if before.channel and before.channel.id == state.voice_channel_id:
+                self._update_human_count(guild, -1)
+            if after.channel and after.channel.id == state.voice_channel_id:
+                self._update_human_count(guild, 1)
 
         except Exception as e:
             logger.error(f"Error in voice state update handler: {e}")
@@ -141,6 +460,7 @@ class Music(commands.Cog):
     
 
     @commands.command()
+    @audio_backend_ready()
     async def pause(self, ctx: commands.Context):
         """Pause the current track"""
         try:
@@ -162,6 +482,7 @@ class Music(commands.Cog):
             await ctx.send("❌ An error occurred!")
 
     @commands.command()
+    @audio_backend_ready()
     async def resume(self, ctx: commands.Context):
         """Resume the current track"""
         try:
@@ -184,46 +505,136 @@ class Music(commands.Cog):
 
     @commands.Cog.listener()
     async def on_wavelink_track_start(self, payload):
+        if payload.player and payload.player.guild:
+            log_context.set({'guild': payload.player.guild.id})
         logger.info(f"Track started playing: {payload.track.title}")
 
     @commands.Cog.listener()
     async def on_wavelink_track_end(self, payload: wavelink.TrackEndEventPayload):
         """Handle track end event and play next song in queue if available"""
         try:
-            guild_id = payload.player.guild.id
-            
-            # Don't send messages if this was triggered by a skip command
-            if guild_id in self.skip_flags and self.skip_flags[guild_id]:
+            if not payload.player or not payload.player.guild:
                 return
-                
-            if guild_id in self.queue and self.queue[guild_id]:
-                next_track = self.queue[guild_id].pop(0)
-                await payload.player.play(next_track)
-                
-                if guild_id in self.command_channels:
-                    channel = self.command_channels[guild_id]
-                    embed = discord.Embed(
-                        title="🎵 Now Playing",
-                        description=f"**{next_track.title}**",
-                        color=discord.Color.blue()
-                    )
-                    embed.add_field(name="Duration", value=format_duration(next_track.length))
-                    
-                    view = MusicControlView()
-                    await channel.send(embed=embed, view=view)
+            log_context.set({'guild': payload.player.guild.id})
+
+            # Skips, stops and replaced tracks are handled by whatever caused them
+            if payload.reason not in ('finished', 'loadFailed'):
+                return
+
+            # Never dropped, otherwise playback would stall
+            self.actors.submit(payload.player.guild.id, lambda: self._advance(payload.player), bounded=False)
                 
         except Exception as e:
             logger.error(f"Error in track end event handler: {e}")
 
+    async def cog_command_error(self, ctx: commands.Context, error: Exception):
+        if isinstance(getattr(error, 'original', error), BackendWarmingUp):
+            await ctx.send("🔧 The audio backend is warming up, please try again in a few seconds!")
+        else:
+            # Having a cog handler stops the bot's default one, so log what it would have printed
+            logger.error(f"Ignoring exception in command {ctx.command}: {error}", exc_info=error)
+
     @commands.Cog.listener()
-    async def on_wavelink_node_ready(self, node):
-        logger.info(f"Wavelink node '{node}' is ready!")
+    async def on_wavelink_node_ready(self, payload: wavelink.NodeReadyEventPayload):
+        logger.info(f"Wavelink node '{payload.node.identifier}' is ready! (resumed: {payload.resumed})")
+        resume_state.set_session(payload.node.identifier, payload.session_id)
+        if payload.resumed:
+            asyncio.create_task(self._reattach_players(payload.node))
+        else:
+            # Lavalink restarted, the new session has none of the players we still had on this node
+            players = balancer.players_on(payload.node)
+            if players:
+                asyncio.create_task(balancer.replay(payload.node, players))
+
+    async def _reattach_players(self, node: wavelink.Node):
+        """Take back the players a previous process left running on a resumed session
+
+        Voice reconnects are paced (RESUME_CONNECTS_PER_SECOND) and bounded
+        (RESUME_CONCURRENCY) so hundreds of guilds don't handshake at once.
+        Guilds that are actually playing go first.
+        """
+        await self.bot.wait_until_ready()
+        try:
+            reported = await node.send('GET', path=f'v4/sessions/{node.session_id}/players')
+        except Exception as e:
+            logger.error(f"Failed to fetch players to resume on node {node.identifier}: {e}")
+            return
+
+        reported.sort(key=lambda data: (data.get('track') is None, data.get('paused', False)))
+        rate = float(os.getenv('RESUME_CONNECTS_PER_SECOND', 5))
+        semaphore = asyncio.Semaphore(int(os.getenv('RESUME_CONCURRENCY', 10)))
+        started = time.monotonic()
+        reattaching = []
+        for data in reported:
+            reattaching.append(asyncio.create_task(self._reattach_player(node, data, semaphore)))
+            await asyncio.sleep(1 / rate)
+        results = await asyncio.gather(*reattaching)
+        logger.info(f"Resumed {sum(results)}/{len(reported)} players on node {node.identifier} "
+                    f"in {time.monotonic() - started:.1f}s")
+
+    async def _reattach_player(self, node: wavelink.Node, data: dict, semaphore: asyncio.Semaphore) -> bool:
+        guild_id = int(data['guildId'])
+        log_context.set({'guild': guild_id})
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return False  # Another shard/cluster's guild, or we were removed from it
+        if guild.voice_client:
+            return False  # Someone started playing again before we got here
+
+        saved = resume_state.previous_players.get(guild_id, {})
+        channel = guild.get_channel(saved.get('voice') or 0)
+        queue = self.get_queue(guild_id)
+        has_work = data.get('track') or queue
+        if channel is None or not has_work or not any(not m.bot for m in channel.members):
+            # Nothing left to do there, don't leave the player running on the node
+            try:
+                await node.send('DELETE', path=f'v4/sessions/{node.session_id}/players/{guild_id}')
+            except Exception as e:
+                logger.warning(f"Failed to drop stale player for guild {guild_id}: {e}")
+            return False
+
+        async with semaphore:
+            try:
+                text_channel = guild.get_channel(saved.get('text') or 0)
+                if text_channel:
+                    self.set_command_channel(guild_id, text_channel)
+                vc = await channel.connect(cls=lambda client, connectable: BalancedPlayer(client, connectable, nodes=[node]))
+            except Exception as e:
+                logger.error(f"Failed to reattach player in guild {guild_id}: {e}")
+                return False
+
+        if data.get('track'):
+            # A fresh wavelink.Player knows nothing, fill in what the node is doing
+            track = wavelink.Playable(data['track'])
+            vc._current = track
+            vc._paused = data.get('paused', False)
+            vc._volume = data.get('volume', 100)
+            vc._last_position = data.get('state', {}).get('position', 0)
+            vc._last_update = time.monotonic_ns()
+
+            # The snapshot may predate the pop of the track that is playing now
+            if queue and queue[0].encoded == track.encoded:
+                queue.popleft()
+            if text_channel:
+                self.update_now_playing(guild_id, text_channel, track)
+        else:
+            # The track ended while nobody was listening to the node's events
+            self.actors.submit(guild_id, lambda: self._advance(vc), bounded=False)
+        return True
+
+    @commands.Cog.listener()
+    async def on_wavelink_node_disconnected(self, payload: wavelink.NodeDisconnectedEventPayload):
+        try:
+            await balancer.failover(payload.node, resume_timeout=float(os.getenv('LAVALINK_RESUME_TIMEOUT', 60)))
+        except Exception as e:
+            logger.error(f"Error moving players off node {payload.node.identifier}: {e}")
 
     @commands.Cog.listener()
     async def on_wavelink_error(self, payload):
         logger.error(f"Wavelink error: {payload.error}")
 
     @commands.command()
+    @audio_backend_ready()
     async def volume(self, ctx: commands.Context, volume: int = None):
         """Set or show the volume (0-100)"""
         if not ctx.voice_client:
@@ -241,18 +652,19 @@ class Music(commands.Cog):
     @commands.Cog.listener()
     async def on_wavelink_track_exception(self, payload):
         """Called when a track encounters an exception during playback"""
+        if payload.player and payload.player.guild:
+            log_context.set({'guild': payload.player.guild.id})
         logger.error(f"Track exception: {payload.exception}")
         if payload.player and payload.player.guild:
             channel = payload.player.guild.system_channel
             if channel:
-                await channel.send(f"⚠️ Error playing track: {payload.exception}")
+                self.outbox.send(channel, f"⚠️ Error playing track: {payload.exception}")
 
     @commands.command()
     async def status(self, ctx: commands.Context):
         """Check the status of the music bot"""
         try:
-            node = wavelink.Pool.get_node()
-            if node:
+            if balancer.healthy_nodes():
                 status_info = {
                     "Bot Connected": True,
                     "Voice Connected": ctx.voice_client is not None,
@@ -273,6 +685,40 @@ class Music(commands.Cog):
                     value="✅" if value else "❌",
                     inline=True
                 )
+
+            cache_stats = self.search_cache.stats()
+            embed.add_field(
+                name="Search Cache",
+                value=f"{cache_stats['size']} entries | {cache_stats['hits']} hits / {cache_stats['misses']} misses",
+                inline=False
+            )
+            store_stats = self.track_store.stats()
+            embed.add_field(
+                name="Track Store",
+                value=f"{store_stats['size']} entries | {store_stats['hits']} hits / {store_stats['misses']} misses",
+                inline=False
+            )
+
+            if cluster_link:
+                embed.add_field(
+                    name="Cluster",
+                    value=(f"Cluster {cluster_link.cluster_id} of {len(cluster_link.clusters)} | "
+                           f"{cluster_link.total('players')} players | {cluster_link.total('guilds')} guilds"),
+                    inline=False
+                )
+
+            # Per node load, refreshed in the background by the balancer
+            for node in wavelink.Pool.nodes.values():
+                stats = balancer.stats.get(node.identifier)
+                if stats:
+                    value = (f"{node.status.name} | {stats.playing}/{stats.players} playing\n"
+                             f"CPU {stats.cpu.system_load:.0%} | "
+                             f"Deficit {stats.frames.deficit if stats.frames else 0} | "
+                             f"Load {node_penalty(node, stats):.1f}")
+                else:
+                    value = f"{node.status.name} | {len(node.players)} players"
+                value += f"\nIn flight {admission.inflight.get(node.identifier, 0)}/{admission.max_inflight}"
+                embed.add_field(name=f"Node {node.identifier}", value=value, inline=False)
                 
             await ctx.send(embed=embed)
                 
@@ -280,85 +726,263 @@ class Music(commands.Cog):
             logger.error(f"Error in status command: {e}")
             await ctx.send("❌ Error getting status")
 
-    @commands.command()
+    def update_now_playing(self, guild_id: int, channel: discord.abc.Messageable, track):
+        """Show the track on the guild's now playing panel (superseded updates are dropped by the outbox)"""
+        key = (track.title, track.length)
+        self.outbox.update_panel(channel, lambda: self._render_now_playing(guild_id, channel, key))
+
+    async def _render_now_playing(self, guild_id: int, channel: discord.abc.Messageable, key: tuple):
+        """Edit the guild's panel in place when possible, otherwise send a new one"""
+        state = self.guilds.peek(guild_id)
+        if state is None:
+            return  # The session ended before the update went out
+        message = state.now_playing
+        if message and message.channel.id == channel.id:
+            if state.now_playing_key == key:
+                return
+            try:
+                await message.edit(embed=now_playing_embed(*key), view=self.control_view)
+                state.now_playing_key = key
+                return
+            except discord.NotFound:
+                pass  # Panel was deleted, send a fresh one
+        elif message:
+            # Moved to another channel, retire the old panel
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                pass
+
+        state.now_playing = await channel.send(embed=now_playing_embed(*key), view=self.control_view)
+        state.now_playing_key = key
+
+    def _autoplay_filled(self, guild_id: int):
+        """Autoplay has tracks ready, start one if the queue ran out before they were"""
+        guild = self.bot.get_guild(guild_id)
+        vc = guild.voice_client if guild else None
+        if vc and not vc.playing:
+            # Through the actor like a track end, _advance checks again in order with other operations
+            self.actors.submit(guild_id, lambda: self._advance(vc), bounded=False)
+
+    def _next_up(self, guild_id: int) -> Optional[wavelink.Playable]:
+        """Next queued track, or an autoplay pick once the queue is empty"""
+        queue = self.get_queue(guild_id)
+        record = queue.popleft() if queue else self.autoplay.next_track(guild_id)
+        return record.to_playable() if record else None
+
+    async def _advance(self, player: wavelink.Player):
+        """Play the next queued track after the current one finished"""
+        guild_id = player.guild.id
+        # Something else already started playing in the meantime
+        if player.playing:
+            return
+
+        next_track = self._next_up(guild_id)
+        if next_track is None:
+            return
+        await player.play(next_track)
+        self.autoplay.track_started(guild_id, next_track, len(self.get_queue(guild_id)))
+        channel = self._command_channel(player.guild)
+        if channel:
+            self.update_now_playing(guild_id, channel, next_track)
+
+    async def _skip(self, guild: discord.Guild, channel: discord.abc.Messageable, count: int = 1) -> int:
+        """Skip count tracks with a single play/stop call, returns how many were skipped"""
+        vc = guild.voice_client
+        if not vc or not vc.playing:
+            return 0
+
+        queue = self.get_queue(guild.id)
+        # Drop the tracks the extra skips would have briefly played
+        for _ in range(min(count - 1, len(queue))):
+            queue.popleft()
+
+        next_track = self._next_up(guild.id)
+        if next_track:
+            # Replaces the current track directly, no separate stop round trip
+            await vc.play(next_track)
+            self.autoplay.track_started(guild.id, next_track, len(queue))
+            self.update_now_playing(guild.id, channel, next_track)
+        else:
+            await vc.stop()
+        return count
+
+    async def _play_or_enqueue(self, ctx: commands.Context, vc: wavelink.Player, track,
+                               enqueue: bool = True) -> bool:
+        """Start the track if nothing is playing, otherwise queue it (if enqueue). Returns True if started"""
+        self.title_index.add(ctx.guild.id, TrackRecord.from_playable(track))
+        if not vc.playing:
+            await vc.play(track)
+            self.autoplay.track_started(ctx.guild.id, track, len(self.get_queue(ctx.guild.id)))
+            self.update_now_playing(ctx.guild.id, ctx.channel, track)
+            return True
+
+        if enqueue:
+            self.get_queue(ctx.guild.id).append(TrackRecord.from_playable(track, requester=ctx.author.id))
+            # Slash commands get their own reply from play
+            if ctx.interaction is None:
+                self.outbox.send(ctx.channel, track.title, merge_key="queued")
+        return False
+
+    async def _connect_voice(self, ctx: commands.Context) -> wavelink.Player:
+        vc = await ctx.author.voice.channel.connect(cls=BalancedPlayer)
+        await vc.set_volume(100)
+        return vc
+
+    def _cancel_ingest(self, guild_id: int):
+        state = self.guilds.peek(guild_id)
+        if state and state.ingest_task:
+            state.ingest_task.cancel()
+            state.ingest_task = None
+
+    async def _ingest_playlist(self, guild_id: int, requester: int, tracks, start_index: int,
+                               skipped: int, progress: discord.Message, previous: Optional[asyncio.Task] = None):
+        """Length-filter a resolved playlist and append it to the queue in chunks"""
+        try:
+            # Keep playlists in the order they were requested
+            if previous and not previous.done():
+                await asyncio.wait([previous])
+
+            queue = self.get_queue(guild_id)
+            added = 0
+            last_edit = time.monotonic()
+            for chunk_start in range(start_index, len(tracks), PLAYLIST_CHUNK_SIZE):
+                chunk = tracks[chunk_start:chunk_start + PLAYLIST_CHUNK_SIZE]
+                records = [
+                    TrackRecord.from_playable(track, requester=requester)
+                    for track in chunk if track.length <= MAX_TRACK_LENGTH
+                ]
+                queue.extend(records)
+                added += len(records)
+                skipped += len(chunk) - len(records)
+
+                if time.monotonic() - last_edit > PROGRESS_EDIT_INTERVAL:
+                    last_edit = time.monotonic()
+                    await progress.edit(content=f"📑 Adding tracks to queue... {added} added so far")
+                # Let other guilds run between chunks
+                await asyncio.sleep(0)
+
+            await progress.edit(content=f"📑 Added {added} tracks to queue" +
+                                (f"\n⚠️ Skipped {skipped} tracks that were over 10 minutes" if skipped else ""))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error adding playlist to queue in guild {guild_id}: {e}")
+        finally:
+            state = self.guilds.peek(guild_id)
+            if state and state.ingest_task is asyncio.current_task():
+                state.ingest_task = None
+
+    async def _queue_playlist(self, ctx: commands.Context, vc: wavelink.Player, tracks: list):
+        """Start the first playable track if nothing is playing, queue the rest in the background"""
+        # Only look as far as the first playable track before starting audio
+        first_index = next((i for i, track in enumerate(tracks) if track.length <= MAX_TRACK_LENGTH), None)
+        if first_index is None:
+            return await ctx.send("❌ All songs in this playlist are over 10 minutes!")
+
+        start_index = first_index
+        started = await self.actors.submit(
+            ctx.guild.id, lambda: self._play_or_enqueue(ctx, vc, tracks[first_index], enqueue=False)
+        )
+        if started:
+            start_index += 1
+
+        # Filter and queue the rest in the background
+        progress = await ctx.send(f"📑 Adding {len(tracks) - start_index} tracks to queue...")
+        state = self.guilds.get(ctx.guild.id)
+        previous = state.ingest_task
+        state.ingest_task = spawn(self._ingest_playlist(
+            ctx.guild.id, ctx.author.id, tracks, start_index, first_index, progress, previous
+        ), guild=ctx.guild.id, command=ctx.command.qualified_name, user=ctx.author.id)
+
+    @commands.hybrid_command()
+    @app_commands.describe(search="Song title or URL")
+    @audio_backend_ready()
     async def play(self, ctx: commands.Context, *, search: str):
         """Play a song or playlist by title or URL
         
         Usage:
         !play <song title> - Search and play a song
         !play <url> - Play a song or playlist from URL
+        /play <song title> - Same, with suggestions from songs played before
         """
         try:
-            self.command_channels[ctx.guild.id] = ctx.channel
-            if not ctx.voice_client:
-                if not ctx.author.voice:
-                    return await ctx.send("❌ You need to be in a voice channel!")
-                vc = await ctx.author.voice.channel.connect(cls=wavelink.Player)
-                await vc.set_volume(100)
+            self.set_command_channel(ctx.guild.id, ctx.channel)
+            if not ctx.voice_client and not ctx.author.voice:
+                return await ctx.send("❌ You need to be in a voice channel!")
+
+            if ctx.interaction:
+                # Resolving can take longer than the interaction response deadline
+                await ctx.defer()
+
+            # A picked autocomplete suggestion is already resolved, no search needed
+            known = self.title_index.get(search)
+            is_playlist = known is None and 'list=' in search
+            is_search = known is None and not is_playlist and not search.startswith(('http://', 'https://'))
+
+            if known is not None:
+                tracks = [known.to_playable()]
+                vc = ctx.voice_client or await self._connect_voice(ctx)
             else:
-                vc = ctx.voice_client
+                # Resolve the tracks while we connect to voice
+                if is_search:
+                    fetch = self.searcher.search(search)
+                else:
+                    fetch = self.search_cache.fetch_tracks(search, Lane.PLAYLIST if is_playlist else Lane.INTERACTIVE)
+                fetch_task = asyncio.create_task(fetch)
+                try:
+                    vc = ctx.voice_client or await self._connect_voice(ctx)
+                except Exception:
+                    fetch_task.cancel()
+                    raise
+                tracks = await fetch_task
 
             # Check if it's a playlist URL
-            if 'list=' in search:
-                # Playlist logic...
-                tracks = await wavelink.Pool.fetch_tracks(search)
+            if is_playlist:
                 if not tracks:
                     return await ctx.send("❌ No songs found in playlist!")
-                
-                # Initialize queue if needed
-                if ctx.guild.id not in self.queue:
-                    self.queue[ctx.guild.id] = []
-                
-                # Filter out tracks longer than 10 minutes
-                valid_tracks = [track for track in tracks if track.length <= 600000]
-                skipped_tracks = len(tracks) - len(valid_tracks)
-                
-                # Add tracks to queue
-                if not vc.playing:
-                    first_track = valid_tracks.pop(0)
-                    await vc.play(first_track)
-                    await ctx.send(f"🎵 Now playing: **{first_track.title}**")
-                
-                self.queue[ctx.guild.id].extend(valid_tracks)
-                
-                await ctx.send(f"📑 Added {len(valid_tracks)} tracks to queue" + 
-                             (f"\n⚠️ Skipped {skipped_tracks} tracks that were over 10 minutes" if skipped_tracks else ""))
-                
+                await self._queue_playlist(ctx, vc, tracks)
+
             else:
                 # Single track logic
-                if not search.startswith(('http://', 'https://')):
-                    search = f'ytsearch:{search}'
-
-                tracks = await wavelink.Pool.fetch_tracks(search)
                 if not tracks:
                     return await ctx.send("❌ No songs found!")
                 
                 track = tracks[0]
-                if track.length > 600000:
+                if track.length > MAX_TRACK_LENGTH:
                     return await ctx.send("❌ Song is too long! Please choose a song under 10 minutes.")
                 
                 # Play or add to queue
-                if not vc.playing:
-                    await vc.play(track)
-                    embed = discord.Embed(
-                        title="🎵 Now Playing",
-                        description=f"**{track.title}**",
-                        color=discord.Color.blue()
-                    )
-                    embed.add_field(name="Duration", value=format_duration(track.length))
-                    view = MusicControlView()
-                    await ctx.send(embed=embed, view=view)
-                else:
-                    if ctx.guild.id not in self.queue:
-                        self.queue[ctx.guild.id] = []
-                    self.queue[ctx.guild.id].append(track)
-                    await ctx.send(f"📑 Added to queue: **{track.title}**")
+                started = await self.actors.submit(ctx.guild.id, lambda: self._play_or_enqueue(ctx, vc, track))
+                if ctx.interaction:
+                    await ctx.send(f"🎵 Playing **{track.title}**" if started else f"➕ Added to queue: **{track.title}**")
             
+        except MailboxFull:
+            await ctx.send("⏳ Too many requests pending for this server, please slow down!")
+        except Busy:
+            await ctx.send("🚦 The music backend is busy right now, please try again in a moment!")
         except Exception as e:
             logger.error(f"Error in play command: {e}", exc_info=True)
             await ctx.send("❌ An error occurred!")
 
+    @play.autocomplete('search')
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str) -> list:
+        """Suggestions from the local title index only, Lavalink is far too slow for autocomplete"""
+        return [
+            app_commands.Choice(name=f"{record.title} ({format_duration(record.length)})"[:MAX_CHOICE_LENGTH],
+                                value=record.uri)
+            for record in self.title_index.suggest(interaction.guild_id, current)
+        ]
+
     @commands.command()
+    @commands.is_owner()
+    async def sync(self, ctx: commands.Context):
+        """Register the slash commands with Discord (owner only, rate limited by Discord)"""
+        synced = await self.bot.tree.sync()
+        await ctx.send(f"✅ Synced {len(synced)} slash commands")
+
+    @commands.command()
+    @audio_backend_ready()
     async def skip(self, ctx: commands.Context):
         try:
             if not ctx.voice_client:
@@ -368,34 +992,15 @@ class Music(commands.Cog):
             if not vc.playing:
                 return await ctx.send("Nothing is playing!")
 
-            # Set skip flag
-            self.skip_flags[ctx.guild.id] = True
-            
             # Store the channel where the command was used
-            self.command_channels[ctx.guild.id] = ctx.channel
+            self.set_command_channel(ctx.guild.id, ctx.channel)
             
-            # Stop current track
-            await vc.stop()
+            # Rapid skips are merged into a single skip-by-N
+            await self.actors.submit(ctx.guild.id, lambda count: self._skip(ctx.guild, ctx.channel, count), merge_key="skip")
             await ctx.send("⏭️ Skipped!")
-            
-            # Play next song if available
-            if ctx.guild.id in self.queue and self.queue[ctx.guild.id]:
-                next_track = self.queue[ctx.guild.id].pop(0)
-                await vc.play(next_track)
-                
-                embed = discord.Embed(
-                    title="🎵 Now Playing",
-                    description=f"**{next_track.title}**",
-                    color=discord.Color.blue()
-                )
-                embed.add_field(name="Duration", value=format_duration(next_track.length))
-                
-                view = MusicControlView()
-                await ctx.send(embed=embed, view=view)
-                
-            # Clear skip flag after handling
-            self.skip_flags[ctx.guild.id] = False
                 
+        except MailboxFull:
+            await ctx.send("⏳ Too many requests pending for this server, please slow down!")
         except Exception as e:
             logger.error(f"Error in skip command: {e}")
             await ctx.send("An error occurred while trying to skip the track.")
@@ -405,7 +1010,7 @@ class Music(commands.Cog):
     async def queue(self, ctx: commands.Context):
         """Show the current music queue with pagination"""
         try:
-            if ctx.guild.id not in self.queue or not self.queue[ctx.guild.id]:
+            if not self.get_queue(ctx.guild.id):
                 return await ctx.send("📭 Queue is empty!")
             
             # Get current track if playing
@@ -415,8 +1020,9 @@ class Music(commands.Cog):
             
             # Create queue view with pagination
             view = QueueView(
-                queue_list=self.queue[ctx.guild.id],
-                current_track=current_track
+                queue_list=self.get_queue(ctx.guild.id),
+                current_track=current_track,
+                current_remaining=self._current_remaining(ctx.voice_client)
             )
             
             # Send initial embed with view
@@ -426,6 +1032,167 @@ class Music(commands.Cog):
             logger.error(f"Error in queue command: {e}")
             await ctx.send("❌ An error occurred!")
 
+    @staticmethod
+    def _current_remaining(vc) -> int:
+        """Milliseconds left of the playing track, 0 if nothing is playing"""
+        if not vc or not vc.current:
+            return 0
+        return max(vc.current.length - vc.position, 0)
+
+    @commands.command()
+    async def eta(self, ctx: commands.Context, position: int = None):
+        """Show when a queued song will start
+        
+        Usage:
+        !eta - When your next queued song starts
+        !eta <number> - When the song at that position starts
+        """
+        try:
+            queue = self.get_queue(ctx.guild.id)
+            if not queue:
+                return await ctx.send("📭 Queue is empty!")
+
+            if position is None:
+                # The author's first song in the queue
+                index = next((i for i, track in enumerate(queue) if track.requester == ctx.author.id), None)
+                if index is None:
+                    return await ctx.send("❌ You don't have any songs in the queue!")
+            else:
+                if position < 1 or position > len(queue):
+                    return await ctx.send(f"❌ Please enter a valid position between 1 and {len(queue)}")
+                index = position - 1
+
+            track = queue[index]
+            starts_in = self._current_remaining(ctx.voice_client) + queue.start_offset(index)
+            await ctx.send(f"⏱️ `{index + 1}.` **{track.title}** starts in `{format_duration(starts_in)}`"
+                           if starts_in else f"⏱️ `{index + 1}.` **{track.title}** is up next")
+        except Exception as e:
+            logger.error(f"Error in eta command: {e}")
+            await ctx.send("❌ An error occurred!")
+
+    @commands.command(name='autoplay')
+    async def toggle_autoplay(self, ctx: commands.Context):
+        """Toggle autoplay: keep playing related songs when the queue runs out"""
+        try:
+            enabled = self.autoplay.toggle(ctx.guild.id)
+            if enabled and ctx.voice_client and ctx.voice_client.current:
+                # Get the buffer ready now rather than at the next track boundary
+                self.autoplay.track_started(ctx.guild.id, ctx.voice_client.current, len(self.get_queue(ctx.guild.id)))
+            await ctx.send("📻 Autoplay is now **on**" if enabled else "📻 Autoplay is now **off**")
+        except Exception as e:
+            logger.error(f"Error in autoplay command: {e}")
+            await ctx.send("❌ An error occurred!")
+
+    @commands.command(aliases=['mv'])
+    async def move(self, ctx: commands.Context, source: int, destination: int):
+        """Move a song to another position in the queue
+        
+        Usage:
+        !move <from> <to> - e.g. !move 12 1 to play song 12 next
+        """
+        try:
+            queue = self.get_queue(ctx.guild.id)
+            if not queue:
+                return await ctx.send("📭 Queue is empty!")
+            if not (1 <= source <= len(queue) and 1 <= destination <= len(queue)):
+                return await ctx.send(f"❌ Please enter valid positions between 1 and {len(queue)}")
+
+            track = queue.move(source - 1, destination - 1)
+            await ctx.send(f"↕️ Moved **{track.title}** to position #{destination}")
+        except Exception as e:
+            logger.error(f"Error in move command: {e}")
+            await ctx.send("❌ An error occurred while moving the song!")
+
+    @commands.command()
+    async def shuffle(self, ctx: commands.Context):
+        """Shuffle the queue"""
+        try:
+            queue = self.get_queue(ctx.guild.id)
+            if len(queue) < 2:
+                return await ctx.send("❌ Not enough songs in the queue to shuffle!")
+
+            queue.shuffle()
+            await ctx.send(f"🔀 Shuffled {len(queue)} songs!")
+        except Exception as e:
+            logger.error(f"Error in shuffle command: {e}")
+            await ctx.send("❌ An error occurred while shuffling the queue!")
+
+    @commands.command(name='export')
+    async def export_queue(self, ctx: commands.Context, compression: str = None):
+        """Save the queue to a file that !import loads back
+        
+        Usage:
+        !export - The playing song and the queue as a text file
+        !export gz - Same, gzip compressed for long queues
+        """
+        try:
+            encoded = [track.encoded for track in self.get_queue(ctx.guild.id)]
+            if ctx.voice_client and ctx.voice_client.current:
+                encoded.insert(0, ctx.voice_client.current.encoded)
+            if not encoded:
+                return await ctx.send("📭 Queue is empty!")
+
+            compress = compression == 'gz'
+            data = dump_queue(encoded, compress=compress)
+            filename = f"queue-{ctx.guild.id}.txt" + (".gz" if compress else "")
+            await ctx.send(f"💾 Exported {len(encoded)} songs, load them back with `!import` and this file attached",
+                           file=discord.File(io.BytesIO(data), filename=filename))
+        except Exception as e:
+            logger.error(f"Error in export command: {e}")
+            await ctx.send("❌ An error occurred while exporting the queue!")
+
+    @commands.command(name='import')
+    @audio_backend_ready()
+    async def import_queue(self, ctx: commands.Context):
+        """Load songs from an !export file into the queue
+        
+        Usage:
+        !import - With the file from !export attached
+        """
+        try:
+            self.set_command_channel(ctx.guild.id, ctx.channel)
+            if not ctx.message.attachments:
+                return await ctx.send("❌ Attach a file made with `!export`!")
+            if not ctx.voice_client and not ctx.author.voice:
+                return await ctx.send("❌ You need to be in a voice channel!")
+
+            attachment = ctx.message.attachments[0]
+            if attachment.size > IMPORT_MAX_BYTES:
+                return await ctx.send("❌ That file is too large!")
+            try:
+                encoded, total = load_queue(await attachment.read(), IMPORT_MAX_TRACKS, IMPORT_MAX_BYTES)
+            except ValueError as e:
+                logger.info(f"Rejected queue import in guild {ctx.guild.id}: {e}")
+                return await ctx.send("❌ That isn't a queue exported with `!export`!")
+            if not encoded:
+                return await ctx.send("📭 That export is empty!")
+            if total > len(encoded):
+                await ctx.send(f"⚠️ That export has {total} songs, only the first {len(encoded)} will be added. "
+                               f"Skipped {total - len(encoded)} over the import limit!")
+
+            # Every track decoded in one request, no searches, while we connect to voice
+            decode_task = asyncio.create_task(admission.decode_tracks(encoded))
+            try:
+                vc = ctx.voice_client or await self._connect_voice(ctx)
+            except Exception:
+                decode_task.cancel()
+                raise
+            try:
+                tracks = await decode_task
+            except wavelink.LavalinkException as e:
+                logger.info(f"Lavalink could not decode queue import in guild {ctx.guild.id}: {e}")
+                return await ctx.send("❌ Some songs in that file could not be read!")
+
+            await self._queue_playlist(ctx, vc, tracks)
+
+        except MailboxFull:
+            await ctx.send("⏳ Too many requests pending for this server, please slow down!")
+        except Busy:
+            await ctx.send("🚦 The music backend is busy right now, please try again in a moment!")
+        except Exception as e:
+            logger.error(f"Error in import command: {e}", exc_info=True)
+            await ctx.send("❌ An error occurred while importing the queue!")
+
     @commands.command()
     async def leave(self, ctx: commands.Context):
         try:
@@ -433,8 +1200,7 @@ class Music(commands.Cog):
                 return await ctx.send("I am not in a voice channel!")
             
             await ctx.voice_client.disconnect()
-            if ctx.guild.id in self.queue:
-                self.queue[ctx.guild.id].clear()
+            self.end_session(ctx.guild.id)
             await ctx.send("👋 Disconnected from voice channel!")
             logger.info(f"Bot left voice channel in guild {ctx.guild.id}")
         except Exception as e:
@@ -502,11 +1268,12 @@ class Music(commands.Cog):
     async def clear(self, ctx: commands.Context):
         """Clear all songs from the queue"""
         try:
-            if ctx.guild.id not in self.queue or not self.queue[ctx.guild.id]:
+            if not self.get_queue(ctx.guild.id):
                 return await ctx.send("📭 Queue is already empty!")
             
             # Clear the queue
-            self.queue[ctx.guild.id].clear()
+            self._cancel_ingest(ctx.guild.id)
+            self.get_queue(ctx.guild.id).clear()
             await ctx.send("🗑️ Queue has been cleared!")
             logger.info(f"Queue cleared in guild {ctx.guild.id}")
             
@@ -523,15 +1290,15 @@ class Music(commands.Cog):
         !rm <number> - Shorthand for removesong
         """
         try:
-            if ctx.guild.id not in self.queue or not self.queue[ctx.guild.id]:
+            if not self.get_queue(ctx.guild.id):
                 return await ctx.send("📭 Queue is empty!")
             
             # Check if position is valid
-            if position < 1 or position > len(self.queue[ctx.guild.id]):
-                return await ctx.send(f"❌ Please enter a valid position between 1 and {len(self.queue[ctx.guild.id])}")
+            if position < 1 or position > len(self.get_queue(ctx.guild.id)):
+                return await ctx.send(f"❌ Please enter a valid position between 1 and {len(self.get_queue(ctx.guild.id))}")
             
             # Remove the song (adjust position by -1 since queue is 0-based)
-            removed_song = self.queue[ctx.guild.id].pop(position - 1)
+            removed_song = self.get_queue(ctx.guild.id).remove_at(position - 1)
             
             embed = discord.Embed(
                 title="🗑️ Removed from Queue",
@@ -551,16 +1318,25 @@ class Music(commands.Cog):
             await ctx.send("❌ An error occurred while removing the song!")
 
 class QueueView(discord.ui.View):
-    def __init__(self, queue_list, current_track, per_page=10):
+    def __init__(self, queue_list, current_track, per_page=10, current_remaining=0):
         super().__init__(timeout=60)
         self.queue_list = queue_list
         self.current_track = current_track
+        self.current_remaining = current_remaining  # ms until the queue starts playing
         self.per_page = per_page
+        self._pages = {}  # Page number: Embed, valid for _pages_version of the queue
+        self._pages_version = queue_list.version
         self.current_page = 0
         self.total_pages = max((len(queue_list) + per_page - 1) // per_page, 1)
         
         # Update button states
         self.update_buttons()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if not await admit_interaction(interaction, 'button'):
+            return False
+        time_interaction('queue_page')
+        return True
         
     def update_buttons(self):
         # Disable/Enable previous button
@@ -569,6 +1345,16 @@ class QueueView(discord.ui.View):
         self.next_button.disabled = self.current_page >= self.total_pages - 1
     
     def get_embed(self):
+        # Flipping back and forth reuses pages rendered since the queue last changed
+        if self._pages_version != self.queue_list.version:
+            self._pages.clear()
+            self._pages_version = self.queue_list.version
+        embed = self._pages.get(self.current_page)
+        if embed is None:
+            embed = self._pages[self.current_page] = self._render_page()
+        return embed
+
+    def _render_page(self):
         start_idx = self.current_page * self.per_page
         end_idx = start_idx + self.per_page
         
@@ -585,18 +1371,25 @@ class QueueView(discord.ui.View):
                 inline=False
             )
         
-        # Add queue tracks for current page
+        # Add queue tracks for current page, with when each one starts
         if self.queue_list:
-            queue_text = "\n".join(
-                f"`{i+1}.` {track.title} `[{format_duration(track.length)}]`"
-                for i, track in enumerate(self.queue_list[start_idx:end_idx], start=start_idx)
-            )
-            if queue_text:
-                embed.add_field(name="Up Next", value=queue_text, inline=False)
+            tracks = self.queue_list.page(start_idx, end_idx)
+            lines = []
+            if tracks:
+                starts_in = self.current_remaining + self.queue_list.start_offset(start_idx)
+                for i, track in enumerate(tracks, start=start_idx):
+                    eta = f"in {format_duration(starts_in)}" if starts_in else "next"
+                    lines.append(f"`{i+1}.` {track.title} `[{format_duration(track.length)}]` ⏱️ {eta}")
+                    starts_in += track.length
+            if lines:
+                embed.add_field(name="Up Next", value="\n".join(lines), inline=False)
         
-        # Add page info
+        # Add page info and how long the whole queue runs
+        total = format_duration(self.current_remaining + self.queue_list.total_length)
+        footer = f"{len(self.queue_list)} tracks | {total} remaining"
         if self.total_pages > 1:
-            embed.set_footer(text=f"Page {self.current_page + 1}/{self.total_pages}")
+            footer = f"Page {self.current_page + 1}/{self.total_pages} | {footer}"
+        embed.set_footer(text=footer)
         
         return embed
     
@@ -620,26 +1413,28 @@ class QueueView(discord.ui.View):
 
 
 class MusicControlView(View):
+    """Persistent now playing controls, registered once with bot.add_view"""
+
     def __init__(self):
         super().__init__(timeout=None)
         
         # Play/Pause Button
-        self.play_pause = Button(emoji="⏯️", style=discord.ButtonStyle.primary, row=0)
+        self.play_pause = Button(emoji="⏯️", style=discord.ButtonStyle.primary, row=0, custom_id="music:play_pause")
         self.play_pause.callback = self.play_pause_callback
         
         # Skip Button
-        self.skip = Button(emoji="⏭️", style=discord.ButtonStyle.primary, row=0)
+        self.skip = Button(emoji="⏭️", style=discord.ButtonStyle.primary, row=0, custom_id="music:skip")
         self.skip.callback = self.skip_callback
         
         # Stop Button
-        self.stop = Button(emoji="⏹️", style=discord.ButtonStyle.danger, row=0)
+        self.stop = Button(emoji="⏹️", style=discord.ButtonStyle.danger, row=0, custom_id="music:stop")
         self.stop.callback = self.stop_callback
         
         # Volume Buttons
-        self.volume_down = Button(emoji="🔉", style=discord.ButtonStyle.secondary, row=1)
+        self.volume_down = Button(emoji="🔉", style=discord.ButtonStyle.secondary, row=1, custom_id="music:volume_down")
         self.volume_down.callback = self.volume_down_callback
         
-        self.volume_up = Button(emoji="🔊", style=discord.ButtonStyle.secondary, row=1)
+        self.volume_up = Button(emoji="🔊", style=discord.ButtonStyle.secondary, row=1, custom_id="music:volume_up")
         self.volume_up.callback = self.volume_up_callback
         
         # Add buttons to view
@@ -648,6 +1443,12 @@ class MusicControlView(View):
         self.add_item(self.stop)
         self.add_item(self.volume_down)
         self.add_item(self.volume_up)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if not await admit_interaction(interaction, 'button'):
+            return False
+        time_interaction(interaction.data.get('custom_id', 'button'))
+        return True
         
     async def play_pause_callback(self, interaction: discord.Interaction):
         if not interaction.guild.voice_client:
@@ -665,7 +1466,6 @@ class MusicControlView(View):
         if not interaction.guild.voice_client:
             return await interaction.response.send_message("❌ Not playing anything!", ephemeral=True)
         
-        vc = interaction.guild.voice_client
         guild_id = interaction.guild.id
         
         # Get reference to the Music cog
@@ -674,25 +1474,17 @@ class MusicControlView(View):
             return await interaction.response.send_message("❌ Music system is not ready!", ephemeral=True)
         
         # Store the channel where the button was used
-        music_cog.command_channels[guild_id] = interaction.channel
-        
-        await vc.stop()
-        await interaction.response.send_message("⏭️ Skipped!", ephemeral=True)
+        music_cog.set_command_channel(guild_id, interaction.channel)
         
-        # Play next song if available
-        if guild_id in music_cog.queue and music_cog.queue[guild_id]:
-            next_track = music_cog.queue[guild_id].pop(0)
-            await vc.play(next_track)
-            
-            embed = discord.Embed(
-                title="🎵 Now Playing",
-                description=f"**{next_track.title}**",
-                color=discord.Color.blue()
+        try:
+            skip = music_cog.actors.submit(
+                guild_id, lambda count: music_cog._skip(interaction.guild, interaction.channel, count), merge_key="skip"
             )
-            embed.add_field(name="Duration", value=format_duration(next_track.length))
-            
-            view = MusicControlView()
-            await interaction.followup.send(embed=embed, view=view)
+        except MailboxFull:
+            return await interaction.response.send_message("⏳ Too many requests pending, please slow down!", ephemeral=True)
+
+        await interaction.response.send_message("⏭️ Skipped!", ephemeral=True)
+        await skip
 
     async def stop_callback(self, interaction: discord.Interaction):
         if not interaction.guild.voice_client:
@@ -700,6 +1492,10 @@ class MusicControlView(View):
         
         vc = interaction.guild.voice_client
         await vc.disconnect()
+
+        music_cog = interaction.client.get_cog('Music')
+        if music_cog:
+            music_cog.end_session(interaction.guild.id)
         await interaction.response.send_message("⏹️ Stopped and disconnected!", ephemeral=True)
 
     async def volume_up_callback(self, interaction: discord.Interaction):
@@ -724,9 +1520,114 @@ class MusicControlView(View):
 
 
 
+def collect_bot_metrics() -> list:
+    """Values read at scrape time so nothing is tracked on the hot path"""
+    lines = metrics.scrape_lines('musicbot_gateway_latency_seconds', 'Discord gateway heartbeat latency', [
+        ({}, bot.latency if bot.latency == bot.latency else 0)  # latency is NaN before the first heartbeat
+    ])
+    lines += metrics.scrape_lines('musicbot_players', 'Connected voice players', [
+        ({'node': node.identifier}, len(node.players)) for node in wavelink.Pool.nodes.values()
+    ])
+
+    node_stats = list(balancer.stats.items())
+    for name, documentation, read in (
+        ('musicbot_lavalink_players', 'Players reported by the Lavalink node', lambda st: st.players),
+        ('musicbot_lavalink_playing_players', 'Playing players reported by the Lavalink node', lambda st: st.playing),
+        ('musicbot_lavalink_system_load', 'Lavalink host CPU load', lambda st: st.cpu.system_load),
+        ('musicbot_lavalink_load', 'Lavalink process CPU load', lambda st: st.cpu.lavalink_load),
+        ('musicbot_lavalink_memory_used_bytes', 'Lavalink JVM memory used', lambda st: st.memory.used),
+        ('musicbot_lavalink_frame_deficit', 'Audio frames missing per minute', lambda st: st.frames.deficit if st.frames else 0),
+    ):
+        lines += metrics.scrape_lines(name, documentation, [({'node': node_id}, read(st)) for node_id, st in node_stats])
+
+    lines += metrics.scrape_lines('musicbot_lavalink_requests_in_flight', 'Lavalink REST calls currently running', [
+        ({'node': node_id}, count) for node_id, count in admission.inflight.items()
+    ])
+    lines += metrics.scrape_lines('musicbot_lavalink_requests_waiting', 'Lavalink REST calls waiting for a slot', [
+        ({'lane': lane.name.lower()}, admission.waiting(lane)) for lane in Lane
+    ])
+
+    lines += metrics.scrape_lines('musicbot_rate_limit_buckets', 'Token buckets currently held by the command rate limiter',
+                                  [({}, len(command_limiter.buckets))])
+    lines += metrics.scrape_lines('musicbot_log_records_dropped_total', 'Log records dropped because the writer fell behind',
+                                  [({}, log_setup.queue_handler.dropped if log_setup.queue_handler else 0)], kind='counter')
+    lines += metrics.scrape_lines('musicbot_startup_phase_seconds', 'Time each startup phase took', [
+        ({'phase': phase}, seconds) for phase, seconds in startup_phases.items()
+    ])
+
+    lag = lag_monitor.percentiles()
+    lines += metrics.scrape_lines('musicbot_event_loop_lag_seconds', 'Event loop lag over the recent window', [
+        ({'quantile': '0.5'}, lag['p50']), ({'quantile': '0.9'}, lag['p90']),
+        ({'quantile': '0.99'}, lag['p99']), ({'quantile': '1'}, lag['max'])
+    ])
+    lines += metrics.scrape_lines('musicbot_event_loop_stalls_total', 'Times the event loop was blocked past the threshold',
+                                  [({}, lag_monitor.stalls)], kind='counter')
+
+    music_cog = bot.get_cog('Music')
+    if music_cog:
+        lines += metrics.distribution_lines(
+            'musicbot_queue_length', 'Queued tracks per guild',
+            (len(state.queue) for state in music_cog.guilds.values()), (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+        )
+        lines += metrics.scrape_lines('musicbot_guild_states', 'Guild states resident in memory',
+                                      [({}, len(music_cog.guilds))])
+        lines += metrics.scrape_lines('musicbot_guild_states_evicted_total', 'Guild states evicted after going idle',
+                                      [({}, music_cog.guilds.evicted)], kind='counter')
+        outbox = music_cog.outbox
+        lines += metrics.scrape_lines('musicbot_discord_messages_sent_total', 'Messages/edits sent to Discord by the outbox',
+                                      [({}, outbox.sent)], kind='counter')
+        lines += metrics.scrape_lines('musicbot_discord_messages_merged_total', 'Notices merged or superseded before sending',
+                                      [({}, outbox.merged)], kind='counter')
+        lines += metrics.scrape_lines('musicbot_discord_rate_limited_total', 'Discord 429 responses seen by the outbox',
+                                      [({}, outbox.rate_limited)], kind='counter')
+        cache_stats = music_cog.search_cache.stats()
+        lines += metrics.scrape_lines('musicbot_search_cache_requests_total', 'Search cache lookups', [
+            ({'result': 'hit'}, cache_stats['hits']), ({'result': 'miss'}, cache_stats['misses'])
+        ], kind='counter')
+        searcher = music_cog.searcher
+        lines += metrics.scrape_lines('musicbot_search_hedge_delay_seconds', 'Current delay before a search goes to the secondary source',
+                                      [({}, searcher.hedge_delay)])
+        store_stats = music_cog.track_store.stats()
+        lines += metrics.scrape_lines('musicbot_track_store_requests_total', 'Disk track store lookups', [
+            ({'result': 'hit'}, store_stats['hits']), ({'result': 'miss'}, store_stats['misses'])
+        ], kind='counter')
+    return lines
+
+metrics.register_collector(collect_bot_metrics)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+
+async def profile_handler(request: web.Request) -> web.Response:
+    """Sample the event loop thread for ?seconds=N and return collapsed stacks"""
+    token = os.getenv('PROFILER_TOKEN')
+    if not token:
+        raise web.HTTPNotFound()
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        raise web.HTTPUnauthorized()
+
+    try:
+        seconds = float(request.query.get('seconds', 10))
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds must be a number")
+    if profiler.running:
+        raise web.HTTPConflict(text="A profile is already running")
+
+    # Sample this (the loop) thread from a worker thread so the loop keeps running meanwhile
+    collapsed = await asyncio.to_thread(profiler.profile, threading.get_ident(), max(seconds, 0.1))
+    return web.Response(text=collapsed, content_type='text/plain', headers={
+        'Content-Disposition': 'attachment; filename="profile.collapsed"'
+    })
+
+
 async def start_server():
     app = web.Application()
     app.router.add_get("/", lambda request: web.Response(text="Bot is alive!"))
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/debug/profile", profile_handler)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', int(os.getenv('PORT', 8080)))
@@ -735,13 +1636,10 @@ async def start_server():
 bot = MusicBot()
 
 @bot.event
-
-
-
-
 async def on_ready():
     logger.info(f'Logged in as {bot.user.name} | {bot.user.id}')
-    # Add the Music cog if it hasn't been added yet
+    if "gateway" not in startup_phases:
+        record_phase("gateway", process_started)
 
     activity = discord.Activity(
         type=discord.ActivityType.listening,
@@ -752,29 +1650,46 @@ async def on_ready():
         activity=activity
     )
 
-    if 'Music' not in [cog.qualified_name for cog in bot.cogs.values()]:
-        await bot.add_cog(Music(bot))
-    logger.info("Music cog has been loaded")
+    if cluster_link:
+        cluster_link.start(collect_cluster_stats)
+
+
+def collect_cluster_stats() -> dict:
+    """What this process reports to the rest of the cluster"""
+    return {
+        "players": sum(len(node.players) for node in wavelink.Pool.nodes.values()),
+        "guilds": len(bot.guilds),
+        "shards": len(bot.shards),
+    }
+
+
+async def start_web_server():
+    started = time.monotonic()
+    await start_server()
+    record_phase("web server", started)
+    logger.info("Web server started successfully")
 
-if __name__ == "__main__":
-    async def start_bot():
-        try:
-            # Start the web server first
-            await start_server()
-            logger.info("Web server started successfully")
-            
-            # Start the bot
-            token = os.getenv('BOT_TOKEN')
-            if not token:
-                raise ValueError("BOT_TOKEN not found in environment variables")
-            
-            await bot.start(token)
-        except Exception as e:
-            logger.error(f"Failed to start bot: {e}")
-            raise
 
+async def start_bot():
+    try:
+        token = os.getenv('BOT_TOKEN')
+        if not token:
+            raise ValueError("BOT_TOKEN not found in environment variables")
+
+        # The health endpoint and the gateway login don't depend on each other
+        await asyncio.gather(start_web_server(), bot.start(token))
+    except Exception as e:
+        logger.error(f"Failed to start bot: {e}")
+        raise
+
+
+def main():
     # Run everything
     asyncio.run(start_bot())
 
 
+if __name__ == "__main__":
+    main()
+
+
 
@@ -0,0 +1,177 @@
+"""Logging that never blocks the event loop
+
+Records go onto a bounded queue and are written by a listener thread, so a
+slow stderr/pipe/disk only ever costs the loop a put_nowait. When the queue
+is full records are dropped and counted rather than waited on. Chatty call
+sites are sampled, and every record carries the guild/command it came from.
+"""
+import asyncio
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+
+# Guild/command/user of the command being handled, copied into tasks it starts
+log_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+
+CONTEXT_FIELDS = ('guild', 'command', 'user', 'cluster')
+
+
+def spawn(coro, **fields) -> asyncio.Task:
+    """create_task whose log context is just these fields, not a copy of the caller's
+
+    Tasks that outlive the command that started them would otherwise log
+    every later record as that command and user.
+    """
+    context = contextvars.Context()
+    context.run(log_context.set, fields)
+    return asyncio.get_running_loop().create_task(coro, context=context)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the current log_context (and the cluster ID) to every record"""
+
+    def __init__(self, cluster: str = None):
+        super().__init__()
+        self.cluster = cluster
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        if self.cluster is not None and not hasattr(record, 'cluster'):
+            record.cluster = self.cluster
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets at most burst records per window through from each call site below WARNING
+
+    Messages are mostly f-strings, so the call site (file and line) is the
+    key rather than the text. The first record after a window reports how
+    many were suppressed.
+    """
+
+    def __init__(self, burst: int = 20, window: float = 10.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._sites = {}  # (pathname, lineno): [window start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        site = self._sites.get(key)
+        if site is None or now - site[0] >= self.window:
+            suppressed = site[2] if site else 0
+            self._sites[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the writer falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message now (args may change later), keep the traceback apart for the formatter
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS + ('suppressed',):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+JsonFormatter.converter = time.gmtime
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = " ".join(f"{key}={getattr(record, key)}" for key in CONTEXT_FIELDS + ('suppressed',)
+                           if getattr(record, key, None) is not None)
+        return f"{line} [{context}]" if context else line
+
+
+queue_handler = None  # The DroppingQueueHandler installed on the root logger
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route all logging through a bounded queue to a background writer thread
+
+    LOG_LEVEL (INFO), LOG_FORMAT (json or text), LOG_QUEUE_SIZE (10000),
+    LOG_SAMPLE_BURST (20) records per LOG_SAMPLE_WINDOW (10) seconds per call site.
+    """
+    global queue_handler
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000))))
+    queue_handler.addFilter(SamplingFilter(
+        burst=int(os.getenv('LOG_SAMPLE_BURST', 20)),
+        window=float(os.getenv('LOG_SAMPLE_WINDOW', 10))
+    ))
+    queue_handler.addFilter(ContextFilter(cluster=os.getenv('CLUSTER_ID')))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued on the way out
+    atexit.register(listener.stop)
+    return listener
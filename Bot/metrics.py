@@ -0,0 +1,230 @@
+import logging
+from bisect import bisect_left
+from typing import Callable
+
+
+logger = logging.getLogger('MusicBot')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []  # Counters/Histograms in registration order
+_collectors = []  # Functions called at scrape time, returning exposition lines
+
+
+def _format_labels(labelnames: tuple, values: tuple) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """Get the child for these label values, create it once and reuse it after
+
+        Meant for setup: hot paths keep the children they use (module level
+        or Children) instead of looking them up again on every event.
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Children(dict):
+    """Children of a metric by the value of its next label, each resolved only the first time
+
+    Indexing with a value seen before is a plain dict hit, no label tuple is
+    built and the metric isn't consulted. Metrics with more labels nest one
+    level per label: Children(metric)['GET']['/gateway']['ok'].
+    """
+
+    __slots__ = ('metric', 'prefix')
+
+    def __init__(self, metric: '_Metric', prefix: tuple = ()):
+        super().__init__()
+        self.metric = metric
+        self.prefix = prefix
+
+    def __missing__(self, value):
+        values = self.prefix + (value,)
+        if len(values) == len(self.metric.labelnames):
+            child = self.metric.labels(*values)
+        else:
+            child = Children(self.metric, values)
+        self[value] = child
+        return child
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        return _histogram_lines(self.name, self.labelnames, values, child)
+
+
+def _histogram_lines(name: str, labelnames: tuple, values: tuple, child: _HistogramChild) -> list:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(child.buckets + (float('inf'),), child.counts):
+        cumulative += count
+        le = "+Inf" if bound == float('inf') else repr(bound)
+        labels = _format_labels(labelnames + ('le',), values + (le,))
+        lines.append(f"{name}_bucket{labels} {cumulative}")
+    labels = _format_labels(labelnames, values)
+    lines.append(f"{name}_sum{labels} {child.sum}")
+    lines.append(f"{name}_count{labels} {child.count}")
+    return lines
+
+
+def scrape_lines(name: str, documentation: str, samples: list, kind: str = "gauge") -> list:
+    """Exposition lines for a value computed at scrape time, samples are (labels dict, value)"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return lines
+
+
+def distribution_lines(name: str, documentation: str, values, buckets: tuple) -> list:
+    """Histogram exposition for a set of values sampled at scrape time"""
+    child = _HistogramChild(tuple(buckets))
+    for value in values:
+        child.observe(value)
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} histogram"] + _histogram_lines(name, (), (), child)
+
+
+def register_collector(collector: Callable[[], list]):
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector {collector.__name__} failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+# Hot path metrics, shared across modules
+COMMAND_LATENCY = Histogram(
+    'musicbot_command_duration_seconds', 'Time spent handling a prefix command', ('command',)
+)
+FETCH_LATENCY = Histogram(
+    'musicbot_fetch_tracks_duration_seconds', 'Lavalink track resolution latency', ('source',)
+)
+FETCH_ERRORS = Counter(
+    'musicbot_fetch_tracks_errors_total', 'Failed Lavalink track resolutions', ('source',)
+)
+ADMISSION_WAIT = Histogram(
+    'musicbot_lavalink_admission_wait_seconds', 'Time Lavalink REST calls waited for a slot', ('lane',)
+)
+ADMISSION_SHED = Counter(
+    'musicbot_lavalink_requests_shed_total', 'Lavalink REST calls shed after missing their deadline', ('lane',)
+)
+SEARCH_HEDGES = Counter(
+    'musicbot_search_hedges_total', 'Searches that also went to the secondary source, by which one won', ('winner',)
+)
+COMMANDS_THROTTLED = Counter(
+    'musicbot_commands_throttled_total', 'Commands and button presses rejected by the rate limiter', ('command', 'scope')
+)
+INTERACTION_LATENCY = Histogram(
+    'musicbot_interaction_duration_seconds', 'Time spent handling a slash command or component interaction', ('command',)
+)
+DISCORD_REQUESTS = Counter(
+    'musicbot_discord_requests_total', 'Discord REST calls by route and final status', ('method', 'route', 'status')
+)
+DISCORD_REQUEST_LATENCY = Histogram(
+    'musicbot_discord_request_duration_seconds', 'Discord REST call latency, including rate limit waits',
+    ('method', 'route')
+)
+DISCORD_RATE_LIMITED = Counter(
+    'musicbot_discord_http_rate_limited_total',
+    'Discord 429 responses, including ones discord.py waited out and retried (global ones also count as bot)',
+    ('client',)
+)
+
+
+def query_source(query: str) -> str:
+    """Rough source label for a fetch_tracks query"""
+    prefix, sep, _ = query.partition(':')
+    if sep and prefix.endswith('search'):
+        return prefix
+    if 'youtube.com' in query or 'youtu.be' in query:
+        return 'youtube'
+    if 'soundcloud.com' in query:
+        return 'soundcloud'
+    return 'http'
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import wavelink
+
+
+logger = logging.getLogger('MusicBot')
+
+
+def load_nodes_from_env() -> list:
+    """Build the Lavalink node list from the environment
+
+    LAVALINK_NODES is a comma separated list of URIs, e.g.
+    "https://lava1.example.com:443,https://lava2.example.com:443".
+    Falls back to the single LAVALINK_HOST/LAVALINK_PORT node.
+    """
+    password = os.getenv('LAVALINK_PASSWORD', 'youshallnotpass')
+    uris = [uri.strip() for uri in os.getenv('LAVALINK_NODES', '').split(',') if uri.strip()]
+    if not uris:
+        uris = [f'https://{os.getenv("LAVALINK_HOST")}:{os.getenv("LAVALINK_PORT")}']
+
+    return [
+        wavelink.Node(
+            identifier=uri.split('://', 1)[-1],
+            uri=uri,
+            password=password,
+            # How long Lavalink keeps our players after a disconnect, see resume.py
+            resume_timeout=int(os.getenv('LAVALINK_RESUME_TIMEOUT', 60))
+        )
+        for uri in uris
+    ]
+
+
+def node_penalty(node: wavelink.Node, stats) -> float:
+    """Load score for a node, lower is better (same weighting Lavalink clients commonly use)"""
+    if stats is None:
+        # No stats yet, fall back to the number of players we know about
+        return len(node.players)
+
+    penalty = stats.playing
+    penalty += 1.05 ** (100 * stats.cpu.system_load) * 10 - 10
+    if stats.frames:
+        # Frames are per minute, 3000 = 1 player worth of dropped audio
+        penalty += 1.03 ** (500 * stats.frames.deficit / 3000) * 600 - 600
+        penalty += (1.03 ** (500 * stats.frames.nulled / 3000) * 300 - 300) * 2
+    return penalty
+
+
+class NodeBalancer:
+    """Keeps fresh stats for every Lavalink node and picks the least loaded one"""
+
+    def __init__(self, refresh_interval: float = 30):
+        self.refresh_interval = refresh_interval
+        self.stats = {}  # Node identifier: StatsResponsePayload
+        self._failing_over = set()  # Node identifiers a failover is waiting on
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def healthy_nodes(self, exclude: Optional[wavelink.Node] = None) -> list:
+        return [
+            node for node in wavelink.Pool.nodes.values()
+            if node.status is wavelink.NodeStatus.CONNECTED
+            and (exclude is None or node.identifier != exclude.identifier)
+        ]
+
+    def best_node(self, exclude: Optional[wavelink.Node] = None) -> wavelink.Node:
+        nodes = self.healthy_nodes(exclude)
+        if not nodes:
+            raise wavelink.InvalidNodeException("No connected Lavalink nodes available")
+        return min(nodes, key=lambda node: node_penalty(node, self.stats.get(node.identifier)))
+
+    async def refresh(self):
+        for node in self.healthy_nodes():
+            try:
+                self.stats[node.identifier] = await node.fetch_stats()
+            except Exception as e:
+                logger.warning(f"Failed to fetch stats for node {node.identifier}: {e}")
+                self.stats.pop(node.identifier, None)
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    @staticmethod
+    def players_on(node: wavelink.Node) -> list:
+        """Players using the node, including ones wavelink already dropped from node.players
+
+        wavelink empties node.players when it gives up on a node (before it
+        reports the disconnect), but the players still point at the node.
+        """
+        players = dict(node.players)
+        if node.client is not None:
+            for player in node.client.voice_clients:
+                if isinstance(player, wavelink.Player) and player.node.identifier == node.identifier:
+                    players.setdefault(player.guild.id, player)
+        return list(players.values())
+
+    async def failover(self, node: wavelink.Node, resume_timeout: float, poll_interval: float = 1.0):
+        """Move every player off a node that stayed down, resuming at their last position
+
+        wavelink reports a disconnect at the start of every reconnect attempt,
+        while Lavalink keeps the session's players for resume_timeout seconds.
+        The players are noted right away, then only moved once the node has
+        given up (DISCONNECTED) or the resume window has passed without it
+        coming back. If it does come back, on_wavelink_node_ready takes over:
+        a resumed session still has the players, a new one gets them replayed.
+        Players with no healthy node to go to are left where they are, never
+        disconnected.
+        """
+        if node.identifier in self._failing_over:
+            return  # Already waiting on this node
+        self._failing_over.add(node.identifier)
+        try:
+            players = self.players_on(node)
+            deadline = asyncio.get_running_loop().time() + resume_timeout
+            while node.status is wavelink.NodeStatus.CONNECTING and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(poll_interval)
+            if node.status is wavelink.NodeStatus.CONNECTED:
+                return  # Back up, the ready event resumes or replays its players
+
+            if not players:
+                return
+            self.stats.pop(node.identifier, None)
+            if not self.healthy_nodes(exclude=node):
+                logger.warning(f"Node {node.identifier} is down with {len(players)} players and no other node to move them to")
+                return
+
+            logger.warning(f"Node {node.identifier} went down, moving {len(players)} players")
+            for player in players:
+                try:
+                    target = self.best_node(exclude=node)
+                except wavelink.InvalidNodeException:
+                    logger.warning(f"No healthy node left, {node.identifier} keeps its remaining players")
+                    return
+                try:
+                    await player.switch_node(target)
+                    logger.info(f"Moved player in guild {player.guild.id} to node {target.identifier}")
+                except Exception as e:
+                    logger.error(f"Failed to move player in guild {player.guild.id}: {e}")
+        finally:
+            self._failing_over.discard(node.identifier)
+
+    async def replay(self, node: wavelink.Node, players: list):
+        """Recreate players on a node that came back with a new session
+
+        A restarted Lavalink holds none of our players, while wavelink still
+        has them on the node as if they were playing. Each one sends its
+        voice state again and restarts its track where Lavalink last
+        reported it (the same steps as switch_node, on the same node).
+        """
+        logger.warning(f"Node {node.identifier} came back without its session, replaying {len(players)} players")
+        for player in players:
+            if player.node.identifier != node.identifier:
+                continue  # Moved elsewhere meanwhile
+            try:
+                node._players[player.guild.id] = player
+                await player._dispatch_voice_update()
+                track = player.current
+                if track is None:
+                    await player.set_filters(player.filters)
+                    await player.set_volume(player.volume)
+                    await player.pause(player.paused)
+                    continue
+                await player.play(
+                    track,
+                    replace=True,
+                    start=min(player._last_position, track.length),
+                    volume=player.volume,
+                    filters=player.filters,
+                    paused=player.paused,
+                )
+                logger.info(f"Replayed player in guild {player.guild.id} on node {node.identifier}")
+            except Exception as e:
+                logger.error(f"Failed to replay player in guild {player.guild.id}: {e}")
+
+balancer = NodeBalancer(refresh_interval=float(os.getenv('LAVALINK_STATS_INTERVAL', 30)))
+
+
+class BalancedPlayer(wavelink.Player):
+    """wavelink.Player that starts on the least loaded node"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('nodes', [balancer.best_node()])
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Optional
+
+import discord
+
+from log_setup import spawn
+
+
+logger = logging.getLogger('MusicBot')
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class _Message:
+    __slots__ = ('content', 'embed', 'view', 'merge_key')
+
+    def __init__(self, content, embed, view, merge_key):
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.merge_key = merge_key
+
+
+class _ChannelState:
+    __slots__ = ('channel', 'pending', 'panel', 'tokens', 'refilled_at', 'blocked_until', 'task')
+
+    def __init__(self, channel, capacity: int):
+        self.channel = channel
+        self.pending = deque()
+        self.panel = None  # Latest now playing update, older ones are dropped
+        self.tokens = capacity
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class Outbox:
+    """Per-channel outbound message scheduler
+
+    Each channel gets its own worker so a busy channel never holds up a quiet
+    one. Adjacent short notices are merged into one message, only the newest
+    pending now playing update is sent, and a local copy of Discord's channel
+    bucket (5 messages / 5 seconds) keeps us from sending into a 429.
+    """
+
+    def __init__(self, capacity: int = 5, per: float = 5, merge_window: float = 0.3):
+        self.capacity = capacity
+        self.per = per
+        self.merge_window = merge_window
+        self.formatters = {}  # merge_key: function(list of contents) -> str
+        self._channels = {}  # Channel ID: _ChannelState
+        self.sent = 0
+        self.merged = 0
+        self.rate_limited = 0
+
+    def register_merge(self, merge_key: str, formatter: Callable[[list], str]):
+        self.formatters[merge_key] = formatter
+
+    def send(self, channel, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None,
+             view: Optional[discord.ui.View] = None, merge_key: Optional[str] = None):
+        """Queue a message for the channel (fire and forget)"""
+        state = self._state(channel)
+        state.pending.append(_Message(content, embed, view, merge_key))
+        self._wake(state)
+
+    def update_panel(self, channel, render: Callable):
+        """Queue a now playing update, replacing any update still waiting to go out"""
+        state = self._state(channel)
+        if state.panel is not None:
+            self.merged += 1
+        state.panel = render
+        self._wake(state)
+
+    def _state(self, channel) -> _ChannelState:
+        state = self._channels.get(channel.id)
+        if state is None:
+            state = self._channels[channel.id] = _ChannelState(channel, self.capacity)
+        return state
+
+    def _wake(self, state: _ChannelState):
+        if state.task is None or state.task.done():
+            guild = getattr(state.channel, 'guild', None)
+            state.task = spawn(self._run(state), guild=guild.id if guild else None)
+
+    def _take_token(self, state: _ChannelState) -> float:
+        """Consume a token, or return how long to wait for one"""
+        now = time.monotonic()
+        if state.blocked_until > now:
+            return state.blocked_until - now
+
+        state.tokens = min(self.capacity, state.tokens + (now - state.refilled_at) * self.capacity / self.per)
+        state.refilled_at = now
+        if state.tokens >= 1:
+            state.tokens -= 1
+            return 0
+        return (1 - state.tokens) * self.per / self.capacity
+
+    def _next_message(self, state: _ChannelState) -> _Message:
+        first = state.pending.popleft()
+
+        # Merge a run of notices with the same key
+        if first.merge_key in self.formatters:
+            contents = [first.content]
+            while state.pending and state.pending[0].merge_key == first.merge_key:
+                contents.append(state.pending.popleft().content)
+            self.merged += len(contents) - 1
+            return _Message(self.formatters[first.merge_key](contents), None, None, None)
+
+        # Join plain text notices while they fit in one message
+        if first.embed is None and first.view is None and first.merge_key is None and first.content:
+            content = first.content
+            while state.pending:
+                nxt = state.pending[0]
+                if nxt.embed or nxt.view or nxt.merge_key or not nxt.content:
+                    break
+                if len(content) + len(nxt.content) + 1 > MAX_MESSAGE_LENGTH:
+                    break
+                content += "\n" + state.pending.popleft().content
+                self.merged += 1
+            first.content = content
+        return first
+
+    async def _run(self, state: _ChannelState):
+        try:
+            while state.pending or state.panel:
+                # Give mergeable notices a moment to pile up
+                if state.pending and state.pending[0].merge_key and len(state.pending) == 1:
+                    await asyncio.sleep(self.merge_window)
+
+                wait = self._take_token(state)
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+
+                try:
+                    if state.pending:
+                        message = self._next_message(state)
+                        try:
+                            await state.channel.send(content=message.content, embed=message.embed, view=message.view)
+                        except discord.HTTPException as e:
+                            if e.status != 429:
+                                raise
+                            # Put it back and wait out the bucket
+                            state.pending.appendleft(message)
+                            self._rate_limited(state, e)
+                            continue
+                    else:
+                        render, state.panel = state.panel, None
+                        try:
+                            await render()
+                        except discord.HTTPException as e:
+                            if e.status != 429:
+                                raise
+                            if state.panel is None:
+                                state.panel = render
+                            self._rate_limited(state, e)
+                            continue
+                    self.sent += 1
+                except Exception as e:
+                    logger.error(f"Failed to send message to channel {state.channel.id}: {e}")
+        finally:
+            if not state.pending and not state.panel and state.blocked_until <= time.monotonic():
+                self._channels.pop(state.channel.id, None)
+
+    def _rate_limited(self, state: _ChannelState, error: discord.HTTPException):
+        self.rate_limited += 1
+        retry_after = getattr(error, 'retry_after', None) or self.per
+        state.blocked_until = time.monotonic() + retry_after
+        state.tokens = 0
+        logger.warning(f"Rate limited in channel {state.channel.id}, backing off {retry_after:.1f}s")
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Optional
+
+
+logger = logging.getLogger('MusicBot')
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * percent / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class LoopLagMonitor:
+    """Measures event loop lag and logs the stack of callbacks that block it
+
+    A coroutine on the loop records how late its sleeps wake up. A watchdog
+    thread checks the loop's heartbeat and, when it stalls longer than
+    block_threshold, logs what the loop thread is running at that moment.
+    """
+
+    def __init__(self, interval: float = 0.25, block_threshold: float = 0.5, window: int = 1200):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.samples = deque(maxlen=window)  # Recent lag values in seconds
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def loop_thread_id(self) -> Optional[int]:
+        return self._loop_thread_id
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def percentiles(self) -> dict:
+        values = sorted(self.samples)
+        return {
+            "p50": _percentile(values, 50),
+            "p90": _percentile(values, 90),
+            "p99": _percentile(values, 99),
+            "max": values[-1] if values else 0.0,
+        }
+
+    async def _probe(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.samples.append(max(now - expected, 0.0))
+            self._heartbeat = now
+
+    def _watch(self):
+        reported = False
+        while not self._stopped.wait(self.block_threshold / 2):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            if blocked_for < self.block_threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+
+            # Only report each stall once, with the stack at the time we noticed it
+            reported = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            logger.warning(f"Event loop blocked for {blocked_for:.3f}s, loop thread is at:\n{stack}")
+
+
+class SamplingProfiler:
+    """Samples a thread's stack and returns it as collapsed stacks (flamegraph.pl / speedscope format)"""
+
+    def __init__(self, max_duration: float = 60, interval: float = 0.005):
+        self.max_duration = max_duration
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, thread_id: int, duration: float) -> str:
+        """Blocking, run it in a worker thread"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            duration = min(duration, self.max_duration)
+            stacks = Counter()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[self._collapse(frame)] += 1
+                time.sleep(self.interval)
+            return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
@@ -0,0 +1,45 @@
+import gzip
+import re
+import zlib
+
+
+EXPORT_HEADER = "musicbot-queue 1"
+GZIP_MAGIC = b'\x1f\x8b'
+_ENCODED_TRACK = re.compile(r'^[A-Za-z0-9+/]+={0,2}$')
+
+
+def dump_queue(encoded_tracks: list, compress: bool = False) -> bytes:
+    """A queue export: a header line, then one Lavalink encoded track per line"""
+    data = "\n".join([EXPORT_HEADER, *encoded_tracks]).encode() + b"\n"
+    return gzip.compress(data) if compress else data
+
+
+def load_queue(data: bytes, max_tracks: int, max_size: int) -> tuple:
+    """(encoded tracks, tracks in the export) for an export (plain or gzip), raises ValueError if it isn't one
+
+    Compressed exports are inflated to at most max_size bytes, so a small
+    upload can't expand into something huge. Tracks past max_tracks are
+    dropped, compare the count with the list to tell how many.
+    """
+    if data.startswith(GZIP_MAGIC):
+        inflater = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            data = inflater.decompress(data, max_size)
+        except zlib.error as e:
+            raise ValueError(f"corrupt gzip data: {e}") from None
+        if inflater.unconsumed_tail:
+            raise ValueError(f"export is larger than {max_size} bytes uncompressed")
+
+    try:
+        lines = data.decode().splitlines()
+    except UnicodeDecodeError:
+        raise ValueError("export is not text") from None
+    if not lines or lines[0].strip() != EXPORT_HEADER:
+        raise ValueError("missing export header")
+
+    tracks = [line.strip() for line in lines[1:] if line.strip()]
+    total = len(tracks)
+    tracks = tracks[:max_tracks]
+    if not all(_ENCODED_TRACK.match(track) for track in tracks):
+        raise ValueError("invalid encoded track")
+    return tracks, total
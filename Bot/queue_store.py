@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Optional
+
+from guild_queue import GuildQueue, TrackRecord
+
+
+logger = logging.getLogger('MusicBot')
+
+
+class _Changes:
+    """A guild's queue rows waiting to be written"""
+
+    __slots__ = ('reset', 'rows')
+
+    def __init__(self):
+        self.reset = False  # Delete all of the guild's stored rows first
+        self.rows = {}  # Seq: row to write, or None to delete it
+
+    def followed_by(self, newer: Optional['_Changes']) -> '_Changes':
+        """These changes with newer ones applied on top"""
+        if newer is None:
+            return self
+        if newer.reset:
+            return newer
+        self.rows.update(newer.rows)
+        return self
+
+
+class QueueStore:
+    """SQLite (WAL) rows of guild queue entries with batched write-behind
+
+    Every entry is its own row, ordered by a sort key (seq) the entry
+    carries. Queues report each mutation through GuildQueue.on_change and
+    only the rows it touched are recorded: an append inserts rows, a pop
+    deletes one, a move rewrites one with a key between its new neighbours.
+    Only shuffle and clear start the guild's rows over. A background task
+    writes the recorded rows of all guilds in one transaction every
+    flush_interval seconds, off the event loop.
+    """
+
+    def __init__(self, path: str = 'queues.db', flush_interval: float = 2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._changes = {}  # Guild ID: _Changes since the last flush
+        self._writing = set()  # Guild IDs whose changes are being written right now
+        self._queues = {}  # Guild ID: GuildQueue being tracked
+        self._detached = {}  # Guild ID: records of a queue detached before its changes were written
+        self._prefetched = {}  # Guild ID: records read off the loop for the next load
+        self._lock = threading.Lock()  # Guards the writer connection
+        self._task: Optional[asyncio.Task] = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue_entries ("
+            "guild_id INTEGER NOT NULL, seq REAL NOT NULL, encoded TEXT NOT NULL, title TEXT NOT NULL, "
+            "length INTEGER NOT NULL, identifier TEXT NOT NULL, uri TEXT, requester INTEGER, "
+            "PRIMARY KEY (guild_id, seq)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        # Separate connection for restores that can't wait (see load), WAL lets it read while we write
+        self._reader = sqlite3.connect(path)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self._reader.close()
+        with self._lock:
+            self._conn.close()
+
+    def attach(self, guild_id: int, queue: GuildQueue) -> GuildQueue:
+        """Start tracking changes to a guild's queue"""
+        self._queues[guild_id] = queue
+        queue.on_change = lambda op, *args: self._record(guild_id, queue, op, *args)
+        return queue
+
+    def detach(self, guild_id: int):
+        """Stop tracking a guild's queue, unsaved changes are still written on the next flush"""
+        queue = self._queues.pop(guild_id, None)
+        if queue is not None:
+            queue.on_change = None
+            if guild_id in self._changes or guild_id in self._writing:
+                self._detached[guild_id] = list(queue)
+
+    async def prefetch(self, guild_id: int):
+        """Read a guild's stored rows in a thread, so the load() that follows doesn't touch SQLite"""
+        if guild_id in self._queues or guild_id in self._detached or guild_id in self._prefetched:
+            return
+        records = await asyncio.to_thread(self._read_locked, guild_id)
+        # Loaded the slow way meanwhile, its queue is newer than what we read
+        if guild_id not in self._queues and guild_id not in self._detached:
+            self._prefetched[guild_id] = records
+
+    def _read_locked(self, guild_id: int) -> list:
+        with self._lock:
+            return self._read(self._conn, guild_id)
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, guild_id: int) -> list:
+        records = []
+        for seq, *fields in conn.execute(
+            "SELECT seq, encoded, title, length, identifier, uri, requester FROM queue_entries "
+            "WHERE guild_id = ? ORDER BY seq", (guild_id,)
+        ):
+            record = TrackRecord(*fields)
+            record.seq = seq
+            records.append(record)
+        return records
+
+    def load(self, guild_id: int) -> GuildQueue:
+        """Restore a guild's queue from its stored rows (empty if there are none)
+
+        Call prefetch() first where possible. Without it the rows are read
+        right here on the loop, which only event handlers for a guild that
+        isn't resident should end up doing.
+        """
+        queue = GuildQueue()
+        if guild_id in self._detached:
+            # Detached and loaded again before the flush, the database is behind
+            records = self._detached.pop(guild_id)
+        elif guild_id in self._prefetched:
+            records = self._prefetched.pop(guild_id)
+        else:
+            records = self._read(self._reader, guild_id)
+        if records:
+            queue.extend(records)
+            logger.info(f"Restored {len(queue)} queued tracks for guild {guild_id}")
+        return self.attach(guild_id, queue)
+
+    @staticmethod
+    def _row(record: TrackRecord) -> tuple:
+        return record.encoded, record.title, record.length, record.identifier, record.uri, record.requester
+
+    def _record(self, guild_id: int, queue: GuildQueue, op: str, *args):
+        """Note the rows a queue mutation touched, called on the loop right after it"""
+        changes = self._changes.get(guild_id)
+        if changes is None:
+            changes = self._changes[guild_id] = _Changes()
+
+        if op == 'append':
+            records = args[0]
+            before = len(queue) - len(records)
+            seq = queue[before - 1].seq + 1 if before else 0
+            for record in records:
+                record.seq = seq
+                changes.rows[seq] = self._row(record)
+                seq += 1
+        elif op == 'remove':
+            changes.rows[args[0].seq] = None
+        elif op == 'move':
+            record, index = args
+            previous = queue[index - 1].seq if index > 0 else None
+            following = queue[index + 1].seq if index + 1 < len(queue) else None
+            if previous is None:
+                seq = following - 1 if following is not None else 0
+            elif following is None:
+                seq = previous + 1
+            else:
+                seq = (previous + following) / 2
+                if not previous < seq < following:
+                    # Ran out of float precision between the two, renumber the whole queue
+                    self._renumber(queue, changes)
+                    return
+            changes.rows[record.seq] = None
+            record.seq = seq
+            changes.rows[seq] = self._row(record)
+        else:
+            # Shuffled or cleared, every position changed
+            self._renumber(queue, changes)
+
+    def _renumber(self, queue: GuildQueue, changes: _Changes):
+        changes.reset = True
+        changes.rows = {}
+        for seq, record in enumerate(queue):
+            record.seq = seq
+            changes.rows[seq] = self._row(record)
+
+    async def flush(self):
+        if not self._changes:
+            return
+
+        batch, self._changes = self._changes, {}
+        self._writing = set(batch)
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Failed to persist queues: {e}")
+            # Try again on the next flush, with anything changed meanwhile on top
+            for guild_id, changes in batch.items():
+                self._changes[guild_id] = changes.followed_by(self._changes.get(guild_id))
+            return
+        finally:
+            self._writing = set()
+
+        # Only now is the database as new as the detached records (unless they changed again meanwhile)
+        for guild_id in batch:
+            if guild_id in self._detached and guild_id not in self._changes:
+                del self._detached[guild_id]
+
+    def _write(self, batch: dict):
+        with self._lock, self._conn:
+            for guild_id, changes in batch.items():
+                if changes.reset:
+                    self._conn.execute("DELETE FROM queue_entries WHERE guild_id = ?", (guild_id,))
+                deleted = [(guild_id, seq) for seq, row in changes.rows.items() if row is None]
+                written = [(guild_id, seq, *row) for seq, row in changes.rows.items() if row is not None]
+                if deleted and not changes.reset:
+                    self._conn.executemany("DELETE FROM queue_entries WHERE guild_id = ? AND seq = ?", deleted)
+                if written:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO queue_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", written
+                    )
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
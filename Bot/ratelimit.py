@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from metrics import COMMANDS_THROTTLED, Children
+
+
+logger = logging.getLogger('MusicBot')
+
+_THROTTLED = Children(COMMANDS_THROTTLED)  # Command, then scope
+
+# (tokens per second, burst) per scope. Searches and player changes cost the most.
+DEFAULT_LIMITS = {
+    'default': {'user': (1, 5), 'guild': (5, 20), 'global': (50, 200)},
+    'play': {'user': (0.25, 3), 'guild': (2, 10)},
+    'skip': {'user': (0.5, 3), 'guild': (2, 6)},
+    'button': {'user': (1, 4), 'guild': (4, 12)},
+    'import': {'user': (1 / 30, 2), 'guild': (1 / 10, 3)},
+}
+
+
+class TokenBuckets:
+    """Token buckets keyed by anything, stored as [tokens, updated_at] only while not full
+
+    A bucket that has refilled completely holds no information, so sweep()
+    drops those entries and the store only grows with currently busy keys.
+    """
+
+    def __init__(self, sweep_interval: float = 60):
+        self._buckets = {}  # Key: [tokens, updated_at, rate, burst]
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _level(self, key, rate: float, burst: float, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return burst
+        return min(burst, bucket[0] + (now - bucket[1]) * rate)
+
+    def wait_time(self, key, rate: float, burst: float, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now"""
+        level = self._level(key, rate, burst, now)
+        return 0.0 if level >= 1 else (1 - level) / rate
+
+    def take(self, key, rate: float, burst: float, now: float) -> None:
+        self._buckets[key] = [self._level(key, rate, burst, now) - 1, now, rate, burst]
+
+    def sweep(self, now: float) -> None:
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+
+class CommandLimiter:
+    """Admission for commands and component interactions, per user, per guild and globally
+
+    Limits are looked up per command name, falling back to 'default' for
+    every scope a command doesn't override. RATE_LIMITS (JSON, same shape as
+    DEFAULT_LIMITS) overrides them. A command is only charged if every scope
+    admits it, so rejected spam doesn't drain the guild or global buckets.
+    """
+
+    def __init__(self, limits: Optional[dict] = None, notice_cooldown: float = 30):
+        self.limits = limits or DEFAULT_LIMITS
+        self.notice_cooldown = notice_cooldown
+        self.buckets = TokenBuckets()
+        self._noticed = {}  # User ID: when they were last told to slow down
+
+    @classmethod
+    def from_env(cls) -> 'CommandLimiter':
+        limits = {name: dict(scopes) for name, scopes in DEFAULT_LIMITS.items()}
+        overrides = os.getenv('RATE_LIMITS')
+        if overrides:
+            try:
+                for name, scopes in json.loads(overrides).items():
+                    limits.setdefault(name, {}).update({scope: tuple(limit) for scope, limit in scopes.items()})
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.error(f"Ignoring invalid RATE_LIMITS: {e}")
+        return cls(limits, notice_cooldown=float(os.getenv('RATE_LIMIT_NOTICE_COOLDOWN', 30)))
+
+    def _limit(self, command: str, scope: str) -> tuple:
+        return self.limits.get(command, {}).get(scope) or self.limits['default'][scope]
+
+    def admit(self, command: str, user_id: int, guild_id: Optional[int]) -> float:
+        """Charge the command if allowed, returns 0 or the seconds to wait before retrying"""
+        now = time.monotonic()
+        self.buckets.sweep(now)
+        keys = {
+            'user': ('user', command, user_id),
+            'guild': ('guild', command, guild_id),
+            'global': ('global', command),
+        }
+        if guild_id is None:
+            del keys['guild']
+
+        for scope, key in keys.items():
+            wait = self.buckets.wait_time(key, *self._limit(command, scope), now)
+            if wait:
+                _THROTTLED[command][scope].inc()
+                return wait
+
+        for scope, key in keys.items():
+            self.buckets.take(key, *self._limit(command, scope), now)
+        return 0.0
+
+    def should_notify(self, user_id: int) -> bool:
+        """True for the first rejection of a user in a while, later ones stay silent"""
+        now = time.monotonic()
+        if now - self._noticed.get(user_id, -self.notice_cooldown) < self.notice_cooldown:
+            return False
+        if len(self._noticed) > 10000:
+            self._noticed = {uid: at for uid, at in self._noticed.items() if now - at < self.notice_cooldown}
+        self._noticed[user_id] = now
+        return True
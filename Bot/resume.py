@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+
+logger = logging.getLogger('MusicBot')
+
+
+class ResumeState:
+    """Lavalink session IDs and player channels, saved so a restarted process can take its players back
+
+    Lavalink keeps a session's players alive for resume_timeout seconds
+    after the websocket drops. Reconnecting with the saved Session-Id
+    resumes it, the voice/text channels tell us where each player was.
+    The file is tiny and rewritten atomically, at most every save_delay.
+    """
+
+    def __init__(self, path: str, save_delay: float = 1.0):
+        self.path = path
+        self.save_delay = save_delay
+        self.sessions = {}  # Node identifier: session ID
+        self.players = {}  # Guild ID: {"voice": channel ID, "text": channel ID or None}
+        self.previous_players = {}  # What the last process left behind, used to reattach
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable resume state {self.path}: {e}")
+            return
+
+        self.sessions = dict(data.get("sessions", {}))
+        self.players = {int(guild_id): player for guild_id, player in data.get("players", {}).items()}
+        # Voice state events for the new process overwrite players, keep what we started with
+        self.previous_players = dict(self.players)
+        logger.info(f"Loaded resume state: {len(self.sessions)} sessions, {len(self.players)} players")
+
+    def apply_sessions(self, nodes: list) -> None:
+        """Make the nodes resume their last session when they connect"""
+        for node in nodes:
+            session_id = self.sessions.get(node.identifier)
+            if session_id:
+                # wavelink sends this as the Session-Id header, there is no public setter
+                node._session_id = session_id
+
+    def set_session(self, node_id: str, session_id: str) -> None:
+        if self.sessions.get(node_id) != session_id:
+            self.sessions[node_id] = session_id
+            self._schedule_save()
+
+    def set_player(self, guild_id: int, voice_channel_id: int, text_channel_id: Optional[int]) -> None:
+        player = {"voice": voice_channel_id, "text": text_channel_id}
+        if self.players.get(guild_id) != player:
+            self.players[guild_id] = player
+            self._schedule_save()
+
+    def remove_player(self, guild_id: int) -> None:
+        if self.players.pop(guild_id, None) is not None:
+            self._schedule_save()
+
+    def _schedule_save(self) -> None:
+        if self._save_handle is None:
+            loop = asyncio.get_running_loop()
+            self._save_handle = loop.call_later(self.save_delay, lambda: asyncio.create_task(self._save()))
+
+    async def _save(self) -> None:
+        self._save_handle = None
+        try:
+            await asyncio.to_thread(self._write, self._snapshot())
+        except Exception as e:
+            logger.error(f"Failed to save resume state: {e}")
+
+    def _snapshot(self) -> dict:
+        return {"sessions": dict(self.sessions), "players": {str(k): v for k, v in self.players.items()}}
+
+    def _write(self, data: dict) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def save_now(self) -> None:
+        """Synchronous save for shutdown, when there's no time left for the debounce"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        try:
+            self._write(self._snapshot())
+        except Exception as e:
+            logger.error(f"Failed to save resume state: {e}")
@@ -0,0 +1,114 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from guild_queue import TrackRecord
+
+
+MAX_CHOICE_LENGTH = 100  # Discord's limit for autocomplete choice names and values
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+class TitleIndex:
+    """Prefix index over tracks the bot has already resolved, for autocomplete
+
+    Every title is indexed from each word onwards ("never gonna give you up"
+    is also found by "give you") plus its URI, as sorted (term, uri) pairs
+    searched with bisect. Matches are ranked by how often the guild played
+    them, then by plays across all guilds. Never touches Lavalink.
+    """
+
+    def __init__(self, max_tracks: int = 5000, max_scan: int = 2000):
+        self.max_tracks = max_tracks
+        self.max_scan = max_scan  # Bound on index entries looked at per lookup
+        self.tracks = {}  # URI: TrackRecord
+        self._terms = []  # Sorted (term, URI)
+        self._plays = defaultdict(Counter)  # Guild ID: URI: plays, only while the guild has any
+        self._players = defaultdict(set)  # URI: guild IDs with plays of it, so eviction only visits those
+        self._total_plays = Counter()  # URI: plays across guilds
+        self._by_plays = []  # Heap of (total plays, URI), entries go stale when the count changes
+
+    def __len__(self):
+        return len(self.tracks)
+
+    @staticmethod
+    def _terms_for(record: TrackRecord) -> set:
+        words = _normalize(record.title).split()
+        terms = {' '.join(words[start:]) for start in range(len(words))}
+        terms.add(record.uri.lower())
+        return terms
+
+    def get(self, uri: str):
+        return self.tracks.get(uri)
+
+    def add(self, guild_id: int, record: TrackRecord) -> None:
+        """Record a play of the track in the guild"""
+        # The URI is the autocomplete value, it has to fit in a choice
+        if not record.uri or len(record.uri) > MAX_CHOICE_LENGTH:
+            return
+
+        if record.uri not in self.tracks:
+            if len(self.tracks) >= self.max_tracks:
+                self._evict()
+            # Queue entries carry a requester, the index doesn't need it
+            self.tracks[record.uri] = TrackRecord(
+                record.encoded, record.title, record.length, record.identifier, record.uri
+            )
+            for term in self._terms_for(record):
+                insort(self._terms, (term, record.uri))
+
+        self._plays[guild_id][record.uri] += 1
+        self._players[record.uri].add(guild_id)
+        self._total_plays[record.uri] += 1
+        heapq.heappush(self._by_plays, (self._total_plays[record.uri], record.uri))
+        if len(self._by_plays) > 2 * self.max_tracks:
+            # Mostly stale entries by now, rebuild from the current counts
+            self._by_plays = [(plays, uri) for uri, plays in self._total_plays.items()]
+            heapq.heapify(self._by_plays)
+
+    def _evict(self) -> None:
+        """Drop the least played track"""
+        while True:
+            plays, uri = heapq.heappop(self._by_plays)
+            if uri in self.tracks and self._total_plays[uri] == plays:
+                break
+
+        record = self.tracks.pop(uri)
+        for term in self._terms_for(record):
+            position = bisect_left(self._terms, (term, uri))
+            if position < len(self._terms) and self._terms[position] == (term, uri):
+                del self._terms[position]
+        del self._total_plays[uri]
+        for guild_id in self._players.pop(uri, ()):
+            plays = self._plays[guild_id]
+            del plays[uri]
+            if not plays:
+                del self._plays[guild_id]
+
+    def release(self, guild_id: int) -> None:
+        """Forget the guild's own play counts, totals across guilds stay"""
+        for uri in self._plays.pop(guild_id, ()):
+            self._players[uri].discard(guild_id)
+
+    def suggest(self, guild_id: int, prefix: str, limit: int = 25) -> list:
+        """Tracks matching the typed prefix, best first"""
+        guild_plays = self._plays.get(guild_id, {})
+        prefix = _normalize(prefix)
+        if not prefix:
+            return [self.tracks[uri] for uri, _ in guild_plays.most_common(limit)]
+
+        matches = set()
+        start = bisect_left(self._terms, (prefix,))
+        for position in range(start, min(start + self.max_scan, len(self._terms))):
+            term, uri = self._terms[position]
+            if not term.startswith(prefix):
+                break
+            matches.add(uri)
+
+        ranked = sorted(matches, key=lambda uri: (
+            -guild_plays.get(uri, 0), -self._total_plays[uri], self.tracks[uri].title
+        ))
+        return [self.tracks[uri] for uri in ranked[:limit]]
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from admission import Busy, Lane, admission
+from guild_queue import TrackRecord
+from metrics import FETCH_ERRORS, FETCH_LATENCY, Children, query_source
+
+
+logger = logging.getLogger('MusicBot')
+
+_FETCH_LATENCY = Children(FETCH_LATENCY)  # By source
+_FETCH_ERRORS = Children(FETCH_ERRORS)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query or URI so equivalent lookups share a cache key"""
+    query = query.strip()
+    if query.startswith(('http://', 'https://')):
+        return query
+
+    # Searches are case/whitespace insensitive, only the source prefix matters
+    prefix, sep, rest = query.partition(':')
+    if sep and prefix in ('ytsearch', 'ytmsearch', 'scsearch'):
+        return f"{prefix}:{' '.join(rest.lower().split())}"
+    return ' '.join(query.lower().split())
+
+
+class SearchCache:
+    """Bounded TTL + LRU cache in front of Lavalink track loading
+
+    Identical lookups that arrive while a request is already in flight
+    wait on that request instead of sending their own. With a TrackStore,
+    single track results also survive restarts (only the first result is
+    kept, which is what play uses).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()  # key: (expires_at, result)
+        self._inflight = {}  # key: Future
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def cached(self, query: str):
+        """The result for a query if it is in memory or the store, without asking Lavalink"""
+        key = normalize_query(query)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        # Resolved before, possibly by an earlier process
+        if self.store is not None:
+            records = self.store.get(key)
+            if records is not None:
+                result = [record.to_playable() for record in records]
+                self.put(key, result)
+                return result
+        return None
+
+    def resolving(self, query: str) -> bool:
+        """Whether fetch_tracks would answer without a new Lavalink request (cached or already in flight)"""
+        key = normalize_query(query)
+        return self.get(key) is not None or key in self._inflight
+
+    async def fetch_tracks(self, query: str, lane: Lane = Lane.INTERACTIVE):
+        """Cached, coalesced equivalent of wavelink.Pool.fetch_tracks, admitted through the given lane"""
+        result = self.cached(query)
+        if result is not None:
+            return result
+
+        # Someone else is already resolving this query, share their result
+        key = normalize_query(query)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # Whoever we joined gave up (e.g. a hedged search that lost), resolve it ourselves
+            return await self.fetch_tracks(query, lane)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        source = query_source(key)
+        started = time.perf_counter()
+        try:
+            result = await admission.fetch_tracks(query, lane)
+            _FETCH_LATENCY[source].observe(time.perf_counter() - started)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not isinstance(e, Busy):
+                _FETCH_ERRORS[source].inc()
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            # Don't cache empty results or live streams
+            if result and not any(getattr(track, 'is_stream', False) for track in result):
+                self.put(key, result)
+                # Playlists change and are large, only single lookups go to disk
+                if self.store is not None and isinstance(result, list):
+                    self.store.put(key, [TrackRecord.from_playable(result[0])])
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
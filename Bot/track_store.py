@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from guild_queue import TrackRecord
+
+
+logger = logging.getLogger('MusicBot')
+
+
+class TrackStore:
+    """Resolved query/URI -> tracks, kept in SQLite (WAL) so restarts don't start cold
+
+    Encoded Lavalink tracks are self-contained, so a stored one can be played
+    without asking Lavalink again. warm() loads the table into memory once,
+    lookups never touch the disk. New and used entries are written behind in
+    batches every flush_interval seconds, off the event loop. Entries older
+    than max_age are ignored and pruned, past max_entries the least recently
+    used go.
+    """
+
+    def __init__(self, path: str = 'tracks.db', max_entries: int = 20000, max_age: float = 7 * 86400,
+                 flush_interval: float = 5):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()  # Key: [resolved_at, used_at, [TrackRecord]], least recently used first
+        self._dirty = set()  # Keys added or used since the last flush
+        self._lock = threading.Lock()  # Guards the connection
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "key TEXT PRIMARY KEY, tracks TEXT NOT NULL, resolved_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tracks_used_at ON tracks (used_at)")
+        self._conn.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def warm(self):
+        """Load the most recently used, unexpired entries into memory"""
+        started = time.monotonic()
+        rows = await asyncio.to_thread(self._read_all)
+        for key, tracks, resolved_at, used_at in reversed(rows):
+            self._entries[key] = [resolved_at, used_at, [TrackRecord(*fields) for fields in json.loads(tracks)]]
+        logger.info(f"Warmed track store with {len(rows)} entries in {time.monotonic() - started:.2f}s")
+
+    def _read_all(self) -> list:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, tracks, resolved_at, used_at FROM tracks WHERE resolved_at >= ? "
+                "ORDER BY used_at DESC LIMIT ?",
+                (time.time() - self.max_age, self.max_entries)
+            ).fetchall()
+
+    def get(self, key: str) -> Optional[list]:
+        """Stored TrackRecords for a normalized query, None if unknown or expired"""
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is None or now - entry[0] > self.max_age:
+            if entry is not None:
+                del self._entries[key]  # The disk copy is pruned on the next flush
+            self.misses += 1
+            return None
+
+        entry[1] = now
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: str, records: list) -> None:
+        now = time.time()
+        self._entries[key] = [now, now, records]
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        batch = []
+        for key in dirty:
+            entry = self._entries.get(key)
+            if entry is not None:
+                resolved_at, used_at, records = entry
+                tracks = [(r.encoded, r.title, r.length, r.identifier, r.uri) for r in records]
+                batch.append((key, json.dumps(tracks, separators=(',', ':')), resolved_at, used_at))
+
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Failed to persist resolved tracks: {e}")
+            # Try again on the next flush
+            self._dirty |= dirty
+
+    def _write(self, batch: list):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks (key, tracks, resolved_at, used_at) VALUES (?, ?, ?, ?)", batch
+            )
+            self._conn.execute("DELETE FROM tracks WHERE resolved_at < ?", (time.time() - self.max_age,))
+            count = self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM tracks WHERE key IN (SELECT key FROM tracks ORDER BY used_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}